@@ -17,6 +17,10 @@
 #     named 'COPYING'. If you have not, visit http://www.gnu.org/licenses/ .
 
 #from adso import core, passwords
-from adso import core, passwords
+from adso import core, passwords, batch
 adso = core.adso
-# pwfile = passwords.pwfile
\ No newline at end of file
+Session = core.Session
+open_many = batch.open_many
+save_many = batch.save_many
+timings = core.timings
+pwfile = passwords.pwfile
\ No newline at end of file
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of adso, which uses PySkein, which is licensed under the 
+# GPL. As far as I can understand, this means that this code must also be 
+# released under the GPL. Since I don't believe in the value of copyright, I 
+# would like apologize to later users for that fact. Nonetheless: 
+# 
+#     Copyright 2010 Chris Drost
+#     
+#     adso is free software: it can be redistributed and modified under the 
+#     terms of the GNU General Public License, version 3, as published by the 
+#     Free Software Foundation. adso is distributed WITHOUT ANY WARRANTIES; 
+#     this includes the implied warranties of MERCHANTABILITY and FITNESS FOR A 
+#     PARTICULAR PURPOSE. See the license for more details. You should have 
+#     received a copy of the license text along with adso, in a text document 
+#     named 'COPYING'. If you have not, visit http://www.gnu.org/licenses/ .
+
+from adso.core import adso, _get_password
+from adso.ciphers import prepared_key
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import os
+import time
+
+# Errors which belong to a single file, and so are collected rather than 
+# raised. adsoSyntaxError and PasswordIncorrect are both ValueErrors.
+_file_errors = (ValueError, EnvironmentError)
+
+class result:
+	"""The outcome of one file in a batch.
+	
+	path: the file which was opened or saved.
+	obj: the adso object which was opened, or None for saves and errors.
+	error: the exception raised for this file, or None.
+	size: the size of the file in bytes.
+	seconds: the time spent on this file by its worker.
+	
+	"""
+	def __init__(self, path, obj=None, error=None, size=0, seconds=0.0):
+		self.path = path
+		self.obj = obj
+		self.error = error
+		self.size = size
+		self.seconds = seconds
+	
+	def __repr__(self):
+		status = 'ok' if self.error == None else repr(self.error)
+		return '<adso.batch.result(%r, %s)>' % (self.path, status)
+
+def _open_one(path, password, kwargs):
+	start = time.time()
+	try:
+		obj = adso.from_file(path, password=password, prompts=False, **kwargs)
+		return result(path, obj, None, os.path.getsize(path), time.time() - start)
+	except _file_errors as e:
+		return result(path, None, e, 0, time.time() - start)
+
+def _save_one(path, obj, password):
+	start = time.time()
+	try:
+		obj.password = password
+		obj._write(path)
+		return result(path, None, None, os.path.getsize(path), time.time() - start)
+	except _file_errors as e:
+		return result(path, None, e, 0, time.time() - start)
+
+class results:
+	"""The results of a batch of adso files, processed in a worker pool.
+	
+	Iterating over this object yields a `result` for each file as soon as it 
+	is finished, in whatever order they finish; wait() finishes them all. 
+	Errors from individual files are collected in `errors` instead of being 
+	raised, so that one bad file does not abort the batch. Aggregate figures 
+	are kept in `files`, `bytes`, `seconds` and `throughput` (bytes/second).
+	
+	"""
+	def __init__(self, fn, jobs, workers=None, processes=False):
+		self.done = []
+		self.errors = []
+		self.bytes = 0
+		self.start = time.time()
+		self.end = None
+		pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(workers)
+		self.pending = [pool.submit(fn, *job) for job in jobs]
+		# the path of each job, for errors which its worker could not catch.
+		self.paths = dict((future, job[0]) for (future, job) in zip(self.pending, jobs))
+		pool.shutdown(wait=False)
+	
+	def __repr__(self):
+		return '<adso.batch.results(%d done, %d errors, %d pending, %.0f bytes/s)>' % \
+			(len(self.done), len(self.errors), len(self.pending), self.throughput)
+	
+	def __iter__(self):
+		for future in as_completed(list(self.pending)):
+			self.pending.remove(future)
+			try:
+				res = future.result()
+			except Exception as e:
+				# such as a result which could not be pickled, or a crashed worker.
+				res = result(self.paths[future], None, e)
+			self.done.append(res)
+			self.bytes += res.size
+			if res.error != None:
+				self.errors.append(res)
+			if len(self.pending) == 0:
+				self.end = time.time()
+			yield res
+	
+	def wait(self):
+		"""Waits for every file to be finished, then returns self."""
+		for res in self:
+			pass
+		return self
+	
+	@property
+	def files(self):
+		return len(self.done)
+	
+	@property
+	def seconds(self):
+		return (time.time() if self.end == None else self.end) - self.start
+	
+	@property
+	def throughput(self):
+		return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+def _shared_password(password, prompts, processes):
+	"""Gets the one password used for a batch: a prepared key for threads, 
+	which share its cached states, or plain bytes for worker processes."""
+	password = _get_password(password, prompts)
+	if processes:
+		return bytes(password.raw()) if isinstance(password, prepared_key) else password
+	return password if isinstance(password, prepared_key) else prepared_key(password)
+
+def open_many(paths, password=None, workers=None, processes=False, prompts=True, **kwargs):
+	"""Decrypts many adso files with one password, in a pool of workers.
+	
+	Usage: r = open_many(paths, password, workers, processes, prompts)
+		paths: the filenames to open.
+		password: the password for all of the files, or a Session. If left 
+			blank, the user will be prompted for it once.
+		workers: the size of the worker pool (default: chosen by Python).
+		processes: use processes instead of threads for the workers.
+	Other keyword arguments are passed to adso.from_file(). Returns a `results` 
+	object, which yields each file's result as soon as it is decrypted.
+	
+	"""
+	password = _shared_password(password, prompts, processes)
+	jobs = [(path, password, kwargs) for path in paths]
+	return results(_open_one, jobs, workers, processes)
+
+def save_many(objs, workers=None, processes=False):
+	"""Encrypts and saves many adso objects, in a pool of workers.
+	
+	Usage: r = save_many(objs, workers, processes)
+		objs: a dict of {filename: adso object}, or a list of such pairs.
+		workers, processes: as for open_many().
+	Any passwords which are needed are prompted for before the work starts.
+	Returns a `results` object, which yields each file's result as soon as it 
+	is saved.
+	
+	"""
+	jobs = []
+	for (path, obj) in (objs.items() if isinstance(objs, dict) else objs):
+		password = obj._password()
+		if processes and isinstance(password, prepared_key):
+			password = bytes(password.raw())
+		jobs.append((path, obj, password))
+	return results(_save_one, jobs, workers, processes)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of adso, which uses PySkein, which is licensed under the
+# GPL. As far as I can understand, this means that this code must also be
+# released under the GPL. Since I don't believe in the value of copyright, I
+# would like apologize to later users for that fact. Nonetheless:
+#
+#     Copyright 2010 Chris Drost
+#
+#     adso is free software: it can be redistributed and modified under the
+#     terms of the GNU General Public License, version 3, as published by the
+#     Free Software Foundation. adso is distributed WITHOUT ANY WARRANTIES;
+#     this includes the implied warranties of MERCHANTABILITY and FITNESS FOR A
+#     PARTICULAR PURPOSE. See the license for more details. You should have
+#     received a copy of the license text along with adso, in a text document
+#     named 'COPYING'. If you have not, visit http://www.gnu.org/licenses/ .
+
+"""Benchmarks for adso. Run them with:
+
+	python -m adso.bench [--sizes 1K,1M] [--only cipher] [--output out.json]
+		[--baseline base.json] [--tolerance 0.1]
+
+Each benchmark is timed at each payload size, taking the best of several
+runs. The results are printed as a table and, with --output, written as JSON.
+Given a --baseline from an earlier --output, every benchmark which has become
+slower by more than the tolerance is reported, and the exit status is 1.
+"""
+
+from adso import core, ciphers, utils, console
+import argparse
+import json
+import platform
+import sys
+import time
+
+_units = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+default_sizes = ['1K', '10K', '100K', '1M', '10M', '100M']
+
+def parse_size(text):
+	"Converts a size such as '10K' or '1M' into a number of bytes."
+	text = text.strip().upper()
+	if text[-1:] in _units:
+		return int(float(text[:-1]) * _units[text[-1]])
+	return int(text)
+
+def timeit(fn, min_time=0.2, max_runs=10):
+	"""Returns the best time of several runs of fn(), running it until 
+	`min_time` seconds have been spent or `max_runs` runs have been made."""
+	(best, spent, runs) = (None, 0.0, 0)
+	while runs < 1 or (spent < min_time and runs < max_runs):
+		start = time.perf_counter()
+		fn()
+		t = time.perf_counter() - start
+		best = t if best == None else min(best, t)
+		(spent, runs) = (spent + t, runs + 1)
+	return best
+
+## Payloads
+# Each function produces data whose serialized size is roughly `size` bytes.
+
+def flat_data(size):
+	return dict(('key%07d' % i, 'v' * 86) for i in range(0, max(1, size // 100)))
+
+def tree_data(size):
+	"A vault-shaped tree: groups of sites, each with a few string fields."
+	groups = max(1, int((size // 100) ** 0.5))
+	sites = max(1, size // (100 * groups))
+	return dict(('group%d' % g, dict(('site%d' % s, {'user': 'u%d' % s, 'tags': 'x'}) \
+		for s in range(0, sites))) for g in range(0, groups))
+
+def command_line(size):
+	words = ['plain', "'single quoted'", '"double \\"quoted\\""', 'back\\ slash']
+	# whole cycles of the words, then single words until the line is long enough.
+	cycle = ' '.join(words)
+	count = max(0, size // (len(cycle) + 1) - 1)
+	line = [cycle] * count
+	(length, i) = ((len(cycle) + 1) * count, 0)
+	while length < size:
+		line.append(words[i % len(words)])
+		(length, i) = (length + len(line[-1]) + 1, i + 1)
+	return ' '.join(line)
+
+## Benchmarks
+# Each benchmark is a function of the size which does its setup and returns
+# the function to be timed.
+
+def bench_adso_to_dict(size):
+	obj = core.adso(flat_data(size), password='benchmark', prompts=False)
+	return obj.to_dict
+
+def bench_adso_from_dict(size):
+	source = core.adso(flat_data(size), password='benchmark', prompts=False).to_dict()
+	return lambda: core.adso.from_dict(source, password='benchmark', prompts=False)
+
+def cipher_benchmarks():
+	"Makes an encrypt and a decrypt benchmark for each registered cipher."
+	out = {}
+	for name in ciphers.supported:
+		def enc(size, name=name):
+			data = b'x' * size
+			return lambda: ciphers.encrypt(name, 'benchmark', 'nonce', data)
+		def dec(size, name=name):
+			data = ciphers.encrypt(name, 'benchmark', 'nonce', b'x' * size)
+			return lambda: ciphers.decrypt(name, 'benchmark', 'nonce', data)
+		out['ciphers.encrypt[%s]' % name] = enc
+		out['ciphers.decrypt[%s]' % name] = dec
+	return out
+
+def bench_derive_key(size):
+	message = b'x' * size
+	return lambda: ciphers.derive_key(b'benchmark', message, 512)
+
+def bench_mac(size):
+	message = b'x' * size
+	return lambda: core._mac(message, 'benchmark', 'nonce')
+
+def bench_traversible_build(size):
+	data = tree_data(size)
+	return lambda: utils.traversible(data)
+
+def bench_traversible_traverse(size):
+	data = tree_data(size)
+	tree = utils.traversible(data)
+	paths = ['/%s/%s/user' % (g, s) for g in data for s in data[g]][:10000]
+	def run():
+		for path in paths:
+			tree.traverse(path)
+	return run
+
+def bench_traversible_traverse_unique(size):
+	"""Looks up every path of a fresh tree once, so that no lookup is ever 
+	repeated and none can be answered by the cache."""
+	data = tree_data(size)
+	paths = ['/%s/%s/%s' % (g, s, f) for g in data for s in data[g] for f in data[g][s]][:100000]
+	def run():
+		tree = utils.traversible(data)
+		for path in paths:
+			tree.traverse(path)
+	return run
+
+def bench_traversible_as_dict(size):
+	tree = utils.traversible(tree_data(size))
+	return tree._as_dict
+
+def bench_traversible_complete(size):
+	data = tree_data(size)
+	tree = utils.traversible(data)
+	prefixes = ['/%s/%s' % (g, s[:-1]) for g in data for s in data[g]][:10000]
+	def run():
+		for prefix in prefixes:
+			tree.complete(prefix)
+	return run
+
+def bench_console_parse(size):
+	line = command_line(size)
+	return lambda: console.DefaultParser.parse(line)
+
+def benchmarks():
+	"Returns all of the benchmarks, by name, in the order they are run."
+	out = {
+		'adso.to_dict': bench_adso_to_dict,
+		'adso.from_dict': bench_adso_from_dict,
+	}
+	out.update(cipher_benchmarks())
+	out.update({
+		'ciphers.derive_key': bench_derive_key,
+		'core._mac': bench_mac,
+		'utils.traversible.build': bench_traversible_build,
+		'utils.traversible.traverse': bench_traversible_traverse,
+		'utils.traversible.traverse_unique': bench_traversible_traverse_unique,
+		'utils.traversible._as_dict': bench_traversible_as_dict,
+		'utils.traversible.complete': bench_traversible_complete,
+		'console.DefaultParser.parse': bench_console_parse,
+	})
+	return out
+
+def run(sizes, only=None, report=None):
+	"""Runs the benchmarks whose names contain `only` (or all of them) at each
+	size, calling report(result) as each finishes. Returns the list of results,
+	which are dicts with the keys name, size, seconds and mb_per_s."""
+	results = []
+	for (name, bench) in benchmarks().items():
+		if only != None and only not in name:
+			continue
+		for size in sizes:
+			seconds = timeit(bench(size))
+			result = {'name': name, 'size': size, 'seconds': seconds,
+				'mb_per_s': size / seconds / 1e6 if seconds > 0 else None}
+			results.append(result)
+			if report != None:
+				report(result)
+	return results
+
+def compare(results, baseline, tolerance=0.1):
+	"""Compares results against an earlier run, returning (name, size, ratio)
+	for every benchmark which is slower by more than `tolerance`."""
+	old = dict(((r['name'], r['size']), r['seconds']) for r in baseline['results'])
+	slower = []
+	for r in results:
+		key = (r['name'], r['size'])
+		if key in old and old[key] > 0 and r['seconds'] > old[key] * (1 + tolerance):
+			slower.append((r['name'], r['size'], r['seconds'] / old[key]))
+	return slower
+
+def _print_result(r):
+	rate = '%10.2f MB/s' % r['mb_per_s'] if r['mb_per_s'] != None else ''
+	print('%-44s %10d %12.6f s %s' % (r['name'], r['size'], r['seconds'], rate))
+	sys.stdout.flush()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m adso.bench',
+		description='Benchmarks adso across payload sizes.')
+	parser.add_argument('--sizes', default=','.join(default_sizes),
+		help='comma-separated payload sizes (default: %(default)s)')
+	parser.add_argument('--only', help='only run benchmarks whose names contain this')
+	parser.add_argument('--output', help='write the results to this JSON file')
+	parser.add_argument('--baseline', help='compare against this earlier --output')
+	parser.add_argument('--tolerance', type=float, default=0.1,
+		help='allowed slowdown against the baseline (default: %(default)s)')
+	args = parser.parse_args(argv)
+
+	sizes = [parse_size(s) for s in args.sizes.split(',')]
+	results = run(sizes, args.only, _print_result)
+	output = {
+		'adso': core.__version__,
+		'python': platform.python_version(),
+		'machine': platform.machine(),
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'results': results,
+	}
+	if args.output != None:
+		with open(args.output, 'w') as f:
+			json.dump(output, f, indent=4)
+	if args.baseline != None:
+		with open(args.baseline, 'r') as f:
+			slower = compare(results, json.load(f), args.tolerance)
+		for (name, size, ratio) in slower:
+			print('SLOWER: %s at %d bytes took %.2fx the baseline time.' % (name, size, ratio))
+		if len(slower) > 0:
+			return 1
+		print('No benchmark is slower than the baseline by more than %d%%.' % (100 * args.tolerance))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
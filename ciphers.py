@@ -17,80 +17,423 @@
 
 
 import skein
+import sys
+import time
 from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 supported = []
 encryptors = {}
 decryptors = {}
+stream_encryptors = {}
+stream_decryptors = {}
+range_decryptors = {}
 
-def encrypt(cipher, key, iv, data):
-	"Encrypts a string of data according to the cipher."
+## Instrumentation
+# Each function in `hooks` is called as hook(name, seconds, size) when an 
+# instrumented stage finishes, where `size` is the number of bytes it handled.
+# adso.core.timings collects these into totals. Stages may be nested: the 
+# 'encrypt' stage includes its 'derive_key' stage, for example.
+hooks = []
+
+class stage:
+	"""Times a block of code for the functions in `hooks`, if there are any.
+	
+	Usage: with stage(name, size) as s: ...
+		The size may also be set afterwards, as s.size = len(output).
+	"""
+	__slots__ = ('name', 'size', 'start')
+	def __init__(self, name, size=0):
+		self.name = name
+		self.size = size
+		self.start = None
+	def __enter__(self):
+		if len(hooks) > 0:
+			self.start = time.perf_counter()
+		return self
+	def __exit__(self, *exc_info):
+		if self.start != None:
+			seconds = time.perf_counter() - self.start
+			for hook in list(hooks):
+				hook(self.name, seconds, self.size)
+
+def encrypt(cipher, key, iv, data, workers=None):
+	"""Encrypts a string of data according to the cipher. Ciphers which support 
+	it will split large inputs across `workers` processes."""
 	if cipher in supported:
-		return encryptors[cipher](key, iv, data)
+		with stage('encrypt', len(data)):
+			return encryptors[cipher](key, iv, data, workers)
 	else:
 		raise ValueError('Cipher "%s" is not supported by this adso instance.' \
 			% cipher)
 
-def decrypt(cipher, key, iv, data):
-	"Decrypts a string of data according to the cipher."
+def decrypt(cipher, key, iv, data, workers=None):
+	"Decrypts a string of data according to the cipher. See encrypt()."
 	if cipher in supported:
-		return decryptors[cipher](key, iv, data)
+		with stage('decrypt', len(data)):
+			return decryptors[cipher](key, iv, data, workers)
+	else:
+		raise ValueError('Cipher "%s" is not supported by this adso instance.' \
+			% cipher)
+
+def encryptor(cipher, key, iv, workers=None):
+	"""Returns a stream encryptor for the cipher. Its update(data) method returns 
+	as much ciphertext as is ready so far, and its final() method returns the 
+	rest; the concatenated output is the same as encrypt(cipher, key, iv, data).
+	Ciphers which cannot stream will buffer everything until final()."""
+	if cipher not in supported:
+		raise ValueError('Cipher "%s" is not supported by this adso instance.' \
+			% cipher)
+	elif cipher in stream_encryptors:
+		return stream_encryptors[cipher](key, iv, workers)
 	else:
+		return _buffered(encryptors[cipher], key, iv, workers)
+
+def decryptor(cipher, key, iv, workers=None):
+	"Returns a stream decryptor for the cipher. See encryptor()."
+	if cipher not in supported:
 		raise ValueError('Cipher "%s" is not supported by this adso instance.' \
 			% cipher)
+	elif cipher in stream_decryptors:
+		return stream_decryptors[cipher](key, iv, workers)
+	else:
+		return _buffered(decryptors[cipher], key, iv, workers)
+
+def decrypt_range(cipher, key, iv, data, offset, workers=None):
+	"""Decrypts `data`, the part of a longer ciphertext which starts `offset` 
+	bytes in (a multiple of 64), without decrypting anything before it. The 
+	output is not stripped of padding. Only ciphers which can seek to a block 
+	offset support this; see `range_decryptors`."""
+	if cipher in range_decryptors:
+		return range_decryptors[cipher](key, iv, _bytes(data), offset, workers)
+	else:
+		raise ValueError('Cipher "%s" cannot decrypt part of a message.' % cipher)
+
+class _buffered:
+	"The stream interface for a cipher which can only process a whole message."
+	def __init__(self, fn, key, iv, workers):
+		self.fn = fn
+		self.key = key
+		self.iv = iv
+		self.workers = workers
+		self.data = bytearray()
+	def update(self, data):
+		self.data += _bytes(data)
+		return b''
+	def final(self):
+		return self.fn(self.key, self.iv, bytes(self.data), self.workers)
 
 
 # Cipher names in 'supported' should contain a namespace and a cipher specification.
 # They should 
 
 _bytes = lambda x: x.encode('utf-8') if type(x) == str else x
-def register(name, enc, dec):
+def register(name, enc, dec, stream_enc=None, stream_dec=None, parallel=False, seek=None):
+	"""Registers a cipher. If `parallel` is True, then all of the given functions 
+	take the number of worker processes as an extra last argument. A cipher 
+	which can start at any block may give `seek`, used for decrypt_range()."""
+	def wrap(fn):
+		if parallel:
+			return lambda key, iv, *args: fn(_bytes(key), _bytes(iv), *args)
+		else:
+			return lambda key, iv, *args: fn(_bytes(key), _bytes(iv), *args[:-1])
+	(enc, dec) = (wrap(enc), wrap(dec))
 	supported.append(name)
-	encryptors[name] = lambda key, iv, data: enc(_bytes(key), _bytes(iv), _bytes(data))
-	decryptors[name] = lambda key, iv, data: dec(_bytes(key), _bytes(iv), _bytes(data))
+	encryptors[name] = lambda key, iv, data, workers: enc(key, iv, _bytes(data), workers)
+	decryptors[name] = lambda key, iv, data, workers: dec(key, iv, _bytes(data), workers)
+	if stream_enc != None:
+		stream_encryptors[name] = wrap(stream_enc)
+	if stream_dec != None:
+		stream_decryptors[name] = wrap(stream_dec)
+	if seek != None:
+		range_decryptors[name] = wrap(seek)
 	
+class prepared_key:
+	"""A key together with the keyed Skein states that adso derives from it.
+	
+	Each state is computed the first time it is needed and then copied for 
+	every later use, so that many messages may be encrypted or decrypted with 
+	the same key while only paying for the nonce-dependent work. All ciphers 
+	accept a prepared_key wherever they accept a key. wipe() zeroes the stored 
+	key and forgets the states, as far as Python allows.
+	
+	"""
+	def __init__(self, key):
+		self.key = bytearray(_bytes(key))
+		self.states = {}
+	
+	def raw(self):
+		"Returns the key itself, for functions which must rekey anyway."
+		if self.key == None:
+			raise ValueError("This key has been wiped.")
+		return self.key
+	
+	def state(self, name, fn):
+		"Returns fn(key), which is only computed once for each name."
+		if name not in self.states:
+			self.states[name] = fn(self.raw())
+		return self.states[name]
+	
+	def wipe(self):
+		if self.key != None:
+			for i in range(0, len(self.key)):
+				self.key[i] = 0
+		self.key = None
+		self.states = {}
+
+_raw = lambda key: key.raw() if isinstance(key, prepared_key) else key
+
+def _kdf_hasher(key, length):
+	return skein.skein512(digest_bits=length, mac=key, pers=b'20100914 spam@drostie.org adso/key_derivation')
+
 def derive_key(key, message, length):
 	"Hashes a message with a key to produce a <length>-bit derived key. This function is adso-specific."
-	s = skein.skein512(digest_bits=length, mac=key, pers=b'20100914 spam@drostie.org adso/key_derivation')
-	s.update(message);
-	return s.digest()
+	with stage('derive_key', len(message)):
+		if isinstance(key, prepared_key):
+			s = key.state(('derive_key', length), lambda k: _kdf_hasher(k, length)).copy()
+		else:
+			s = _kdf_hasher(key, length)
+		s.update(message);
+		return s.digest()
+
+# The tweak for block i is eight zero bytes followed by i as a big-endian 
+# 64-bit counter. (adso has always written its tweaks this way, so it is kept 
+# for compatibility, even though Threefish is otherwise little-endian.)
+_tf_batch = 1024 # blocks per batch of precomputed tweaks, i.e. 64 KiB of data.
+
+def _tf_tweaks(first, count):
+	"Returns the tweaks for blocks first, first + 1, ... concatenated together."
+	arr = array('Q', bytes(16 * count))
+	arr[1::2] = array('Q', range(first, first + count))
+	if sys.byteorder == 'little':
+		arr.byteswap()
+	return arr.tobytes()
 
-__little_endian = not array("L", [1]).tostring()[0]
 def _tf_tweak_ctr(i):
 	# tweak counter goes 0, 1, 2, ..., not 0, 64. 128, ...
-	arr = array('L', [0, i >> 6])
-	if not __little_endian:
-		arr.byteswap()
-	return arr.tostring()
+	return _tf_tweaks(i >> 6, 1)
+
+def _tf_blocks(key, buf, first, decrypting):
+	"""Runs Threefish over the 64-byte blocks of the bytearray `buf` in place. 
+	The first block of `buf` is block number `first` of the message."""
+	cipher = skein.threefish(key, bytes(16))
+	block_fn = cipher.decrypt_block if decrypting else cipher.encrypt_block
+	view = memoryview(buf)
+	blocks = len(buf) // 64
+	for start in range(0, blocks, _tf_batch):
+		count = min(_tf_batch, blocks - start)
+		tweaks = _tf_tweaks(first + start, count)
+		for j in range(0, count):
+			cipher.tweak = tweaks[16 * j : 16 * j + 16]
+			k = 64 * (start + j)
+			view[k : k + 64] = block_fn(view[k : k + 64])
+	view.release()
+	return buf
 
-def _tf_encrypt(key, iv, data):
+# Since every block depends only upon the key and its block number, a large 
+# message can be cut into ranges which are processed in separate processes.
+_tf_span = 2**20 # bytes of data handed to a worker process at a time.
+
+def _tf_range(key, data, first, decrypting):
+	"Runs _tf_blocks in a worker process; see _tf_run()."
+	return _tf_blocks(key, bytearray(data), first, decrypting)
+
+def _tf_pool(workers, size):
+	"Returns a process pool if `workers` is set and `size` bytes are worth splitting."
+	if workers == None or workers <= 1 or size <= _tf_span:
+		return None
+	return ProcessPoolExecutor(workers)
+
+def _tf_run(key, buf, first, decrypting, pool=None):
+	"Like _tf_blocks, but spreads the ranges of `buf` across `pool` if given."
+	if pool == None or len(buf) <= _tf_span:
+		return _tf_blocks(key, buf, first, decrypting)
+	view = memoryview(buf)
+	jobs = [(k, pool.submit(_tf_range, key, view[k : k + _tf_span].tobytes(), 
+		first + k // 64, decrypting)) for k in range(0, len(buf), _tf_span)]
+	for (k, job) in jobs:
+		out = job.result()
+		view[k : k + len(out)] = out
+	view.release()
+	return buf
+
+def _tf_crypt(key, iv, buf, decrypting, workers, first=0):
+	pool = _tf_pool(workers, len(buf))
+	try:
+		return bytes(_tf_run(derive_key(key, iv, 512), buf, first, decrypting, pool))
+	finally:
+		if pool != None:
+			pool.shutdown()
+
+def _tf_encrypt(key, iv, data, workers=None):
 	# adso always uses JSON, so we pad the message with JSON whitespace.
-	while len(data) % 64 != 0:
-		data += b' '
-	cipher = skein.threefish(derive_key(key, iv, 512), _tf_tweak_ctr(0))
-	output = b''
-	for k in range(0, len(data), 64):
-		cipher.tweak = _tf_tweak_ctr(k) 
-		output += cipher.encrypt_block(data[k : k + 64])
-	return output
-
-def _tf_decrypt(key, iv, data):
-	cipher = skein.threefish(derive_key(key, iv, 512), _tf_tweak_ctr(0))
-	output = b''
-	for k in range(0, len(data), 64):
-		cipher.tweak = _tf_tweak_ctr(k)
-		output += cipher.decrypt_block(data[k : k + 64])
-	return output.strip()
-
-register('adso-threefish512/tctr', _tf_encrypt, _tf_decrypt)
+	buf = bytearray(data)
+	buf.extend(b' ' * (-len(buf) % 64))
+	return _tf_crypt(key, iv, buf, False, workers)
+
+def _tf_decrypt(key, iv, data, workers=None):
+	return _tf_crypt(key, iv, bytearray(data), True, workers).strip()
+
+def _tf_seek(key, iv, data, offset, workers=None):
+	return _tf_crypt(key, iv, bytearray(data), True, workers, offset // 64)
+
+class _tf_stream:
+	"""The streaming form of _tf_encrypt and _tf_decrypt. Whole blocks are 
+	processed as soon as they arrive (or, with worker processes, as soon as 
+	there is enough to give each of them a range); when decrypting, trailing 
+	whitespace is held back until we know whether it is padding."""
+	def __init__(self, key, iv, decrypting, workers=None):
+		self.key = derive_key(key, iv, 512)
+		self.decrypting = decrypting
+		self.workers = workers
+		self.pool = None
+		self.batch = workers * _tf_span if workers != None and workers > 1 else 64
+		self.block = 0
+		self.pending = bytearray()
+		self.held = b''
+		self.started = False
+	
+	def _process(self, buf):
+		if self.pool == None and len(buf) > _tf_span:
+			self.pool = _tf_pool(self.workers, len(buf))
+		_tf_run(self.key, buf, self.block, self.decrypting, self.pool)
+		self.block += len(buf) // 64
+		if not self.decrypting:
+			return bytes(buf)
+		out = self.held + buf if self.started else buf.lstrip()
+		text = bytes(out).rstrip()
+		self.held = bytes(out[len(text):])
+		self.started = self.started or len(text) != 0
+		return text
+	
+	def update(self, data):
+		self.pending += _bytes(data)
+		n = len(self.pending) - len(self.pending) % self.batch
+		if n == 0:
+			return b''
+		buf = self.pending[:n]
+		del self.pending[:n]
+		return self._process(buf)
+	
+	def final(self):
+		if self.decrypting and len(self.pending) % 64 != 0:
+			raise ValueError("Ciphertext is not a whole number of blocks.")
+		buf = self.pending + b' ' * (-len(self.pending) % 64)
+		self.pending = bytearray()
+		try:
+			return self._process(buf) if len(buf) != 0 else b''
+		finally:
+			self.close()
+	
+	def close(self):
+		"Shuts down the worker processes, if any were started."
+		if self.pool != None:
+			self.pool.shutdown()
+			self.pool = None
+	
+	def __del__(self):
+		self.close()
+
+register('adso-threefish512/tctr', _tf_encrypt, _tf_decrypt, 
+	lambda key, iv, workers: _tf_stream(key, iv, False, workers), 
+	lambda key, iv, workers: _tf_stream(key, iv, True, workers), 
+	parallel=True, seek=_tf_seek)
 
 def _skein512stream(key, iv, data):
-	stream = array('B', skein.skein512(digest_bits=8 * len(data), mac=key, nonce=iv).digest())
+	stream = array('B', skein.skein512(digest_bits=8 * len(data), mac=_raw(key), nonce=iv).digest())
 	for i in range(0, len(data)):
 		stream[i] ^= data[i]
-	return stream.tostring()
+	return stream.tobytes()
 
 # I would label this as stream-skein512, but the above breaks the spec in a 
 # subtle way: in the Skein spec, digest_bits should be set to a special value, 
 # since you don't always know the length of the message in advance.
 register('adso-skein512', _skein512stream, _skein512stream)
+
+# The spec-correct Skein stream cipher sets the output length to 2**64 - 1 bits 
+# and hashes an empty message with the key and nonce; the keystream is then 
+# the output stage of Skein, run for as many blocks as the data needs. PySkein 
+# can only produce a whole digest at once, so the UBI chaining is done here 
+# on top of its Threefish block cipher.
+_xor = lambda a, b: (int.from_bytes(a, 'little') ^ \
+	int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+def _skein512_ubi(g, message, tweak_type):
+	"Skein-512's Unique Block Iteration: returns the next chaining value."
+	(size, blocks) = (len(message), max(1, -(-len(message) // 64)))
+	message += bytes(64 * blocks - size)
+	for i in range(0, blocks):
+		position = min(64 * (i + 1), size)
+		tweak = position | tweak_type << 120 | (i == 0) << 126 | (i == blocks - 1) << 127
+		block = message[64 * i : 64 * i + 64]
+		g = _xor(skein.threefish(g, tweak.to_bytes(16, 'little')).encrypt_block(block), block)
+	return g
+
+def _skein512_keyed(key, digest_bits):
+	"The chaining value of Skein-512 after the key and configuration blocks."
+	g = bytes(64)
+	if len(key) > 0:
+		g = _skein512_ubi(g, bytes(key), 0)
+	config = b'SHA3' + (1).to_bytes(4, 'little') + digest_bits.to_bytes(8, 'little')
+	return _skein512_ubi(g, config + bytes(16), 4)
+
+def _skein512_chain(key, nonce, digest_bits):
+	"The chaining value of Skein-512 for an empty message, before output."
+	if isinstance(key, prepared_key):
+		g = key.state(('skein512', digest_bits), lambda k: _skein512_keyed(k, digest_bits))
+	else:
+		g = _skein512_keyed(key, digest_bits)
+	if len(nonce) > 0:
+		g = _skein512_ubi(g, nonce, 20)
+	return _skein512_ubi(g, b'', 48)
+
+class _skein512_keystream:
+	"""The Skein-512 stream cipher. Output block i is Threefish, keyed by the 
+	chaining value and with a fixed tweak, applied to the counter i, so the 
+	keystream is generated a batch of blocks at a time and XORed in bulk."""
+	def __init__(self, key, iv, workers=None):
+		tweak = 8 | 63 << 120 | 1 << 126 | 1 << 127
+		g = _skein512_chain(key, iv, 2**64 - 1)
+		self.cipher = skein.threefish(g, tweak.to_bytes(16, 'little'))
+		self.block = 0
+		self.unused = b''
+	
+	def keystream(self, n):
+		"Returns the next `n` bytes of the keystream."
+		out = [self.unused[:n]]
+		n -= len(out[0])
+		self.unused = self.unused[len(out[0]):]
+		while n > 0:
+			count = min(_tf_batch, -(-n // 64))
+			counters = array('Q', bytes(64 * count))
+			counters[::8] = array('Q', range(self.block, self.block + count))
+			if sys.byteorder != 'little':
+				counters.byteswap()
+			counters = counters.tobytes()
+			view = memoryview(counters)
+			stream = b''.join(self.cipher.encrypt_block(view[k : k + 64]) \
+				for k in range(0, len(counters), 64))
+			stream = _xor(stream, counters)
+			self.block += count
+			out.append(stream[:n])
+			self.unused = stream[n:]
+			n -= len(out[-1])
+		return b''.join(out)
+	
+	def update(self, data):
+		data = _bytes(data)
+		return _xor(data, self.keystream(len(data)))
+	
+	def final(self):
+		return b''
+
+def _skein512_xor(key, iv, data):
+	return _skein512_keystream(key, iv).update(data)
+
+def _skein512_seek(key, iv, data, offset):
+	stream = _skein512_keystream(key, iv)
+	stream.block = offset // 64
+	return stream.update(data)
+
+register('adso-skein512/stream', _skein512_xor, _skein512_xor, 
+	_skein512_keystream, _skein512_keystream, seek=_skein512_seek)
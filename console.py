@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
+import io
 import sys
+import re
+from adso.utils import traversible, terminal_display
+try:
+	import readline
+except ImportError:
+	readline = None
 
 running = True
 
@@ -8,93 +15,122 @@ class ParseIncomplete(SyntaxError):
 class ParseError(SyntaxError):
 	pass
 
-class DefaultParser:
-	def __init__(self, text):
-		self.line = text
-		self.at = 0
-		self.end = len(text)
-	def peek(self):
-		return self.line[self.at] if self.at < self.end else None
-	def next(self):
-		k = self.peek()
-		self.at += 1
-		return k
-	def done(self):
-		return self.at >= self.end
-	def parse_single_quote(self):
-		token = ""
-		self.next() # ignore leading quote.
-		while self.peek() != "'":
-			if self.done(): 
-				raise ParseIncomplete()
-			token += self.next()
-		self.next() # skip trailing single quote
-		return token
-	def parse_double_quote(self):
-		token = ""
-		self.next() # ignore leading double-quote.
-		while self.peek() != '"':
-			if self.done():
-				raise ParseIncomplete()
-			elif self.peek() == '\\':
-				self.next()
-				if self.done():
-					raise ParseIncomplete()
-				elif self.peek() == '\n':
-					self.next() # preceding slash suppresses newlines
-				elif self.peek() in '"\\':
-					token += self.next()
+# The states of a Tokenizer: between tokens, in a token, in single or double 
+# quotes, or just after a backslash in one of the other states.
+(_between, _bare, _single, _double) = range(0, 4)
+_space = ' \t\n'
+_not_space = re.compile(r'[^ \t\n]')
+_bare_special = re.compile(r'[ \t\n\\\'"]')
+_double_special = re.compile(r'["\\]')
+
+class Tokenizer:
+	"""Splits text into tokens the way DefaultParser.parse() does, but can be 
+	fed the text a piece at a time: each call to feed() only scans the text it
+	is given, carrying any open quote or backslash over to the next call.
+	
+	Usage: t = Tokenizer()
+		t.feed(line)
+		while t.incomplete: 
+			t.feed('\n' + next_line)
+		tokens = t.tokens()
+	"""
+	def __init__(self):
+		self.done = []
+		self.pieces = None # slices of the current token, or None between tokens
+		self.state = _between
+		self.escaped = False # True after a backslash whose meaning is not known yet
+		self.fed = 0 # the length of all the text fed so far
+		self.start = 0 # where in that text the last token began
+	
+	@property
+	def incomplete(self):
+		return self.escaped or self.state in (_single, _double)
+	
+	def tokens(self):
+		"The tokens so far, counting the last token as finished."
+		if self.incomplete:
+			raise ParseIncomplete()
+		return self.done + ([] if self.pieces == None else ["".join(self.pieces)])
+	
+	def feed(self, text):
+		(at, end, base) = (0, len(text), self.fed)
+		self.fed += end
+		while at < end:
+			if self.escaped:
+				at = self.escape(text, at)
+			elif self.state == _between:
+				match = _not_space.search(text, at)
+				if match == None:
+					return
+				at = match.start()
+				self.start = base + at
+				if text[at] == '\\':
+					# a backslash-newline is whitespace; anything else starts a token.
+					(self.escaped, at) = (True, at + 1)
 				else:
-					token += '\\'
-			else:
-				token += self.next()
-		self.next() # skip trailing double-quote
-		return token
-	def skip_whitespace(self):
-		while not self.done() and self.peek() in ' \t\n\\':
-			if self.peek() == '\\':
-				self.next()
-				if self.done():
-					raise ParseIncomplete() 
-				elif self.peek() == "\n":
-					# this is the only valid use of a backslash as whitespace.
-					self.next()
+					(self.state, self.pieces) = (_bare, [])
+			elif self.state == _bare:
+				match = _bare_special.search(text, at)
+				stop = end if match == None else match.start()
+				self.pieces.append(text[at : stop])
+				if stop == end:
+					return
+				char = text[stop]
+				if char in _space:
+					self.done.append("".join(self.pieces))
+					(self.state, self.pieces) = (_between, None)
+				elif char == '\\':
+					self.escaped = True
 				else:
-					self.at -= 1 # backslash forms part of a token.
+					self.state = _single if char == "'" else _double
+				at = stop + 1
+			elif self.state == _single:
+				stop = text.find("'", at)
+				self.pieces.append(text[at : end if stop < 0 else stop])
+				if stop < 0:
 					return
+				(self.state, at) = (_bare, stop + 1)
 			else:
-				self.next()
-	def parse_token(self):
-		token = ""
-		while not self.done() and self.peek() not in ' \t\n':
-			current = self.peek()
-			if current == '\\':
-				self.next()
-				if self.done():
-					raise ParseIncomplete()
-				elif self.peek() in " \t\\'\"":
-					token += self.next()
-				elif self.peek() == '\n':
-					self.next()
+				match = _double_special.search(text, at)
+				stop = end if match == None else match.start()
+				self.pieces.append(text[at : stop])
+				if stop == end:
+					return
+				if text[stop] == '"':
+					self.state = _bare
 				else:
-					token += '\\'
-			elif current == "'":
-				token += self.parse_single_quote()
-			elif current == '"':
-				token += self.parse_double_quote()
-			else:
-				token += self.next()
-		return token
+					self.escaped = True
+				at = stop + 1
+	
+	def escape(self, text, at):
+		"Handles the character after a backslash, returning where to go on."
+		char = text[at]
+		self.escaped = False
+		if char == '\n':
+			return at + 1 # a backslash-newline is ignored everywhere.
+		elif self.state == _between:
+			# the backslash begins a token.
+			(self.state, self.pieces) = (_bare, [])
+		if self.state == _bare and char in " \t\\'\"" or \
+				self.state == _double and char in '"\\':
+			self.pieces.append(char)
+			return at + 1
+		self.pieces.append('\\')
+		return at
+
+class DefaultParser:
+	@classmethod
+	def tokenizer(cls, context=None):
+		"""Returns a Tokenizer, for consoles which read a command a line at a 
+		time. It is only used in place of parse() and is_incomplete() when a 
+		subclass has not overridden either of them."""
+		return Tokenizer()
 	
 	@classmethod
 	def parse(cls, line, context=None):
-		parser = DefaultParser(line)
-		parser.skip_whitespace()
-		tokens = []
-		while not parser.done():
-			tokens.append(parser.parse_token())
-			parser.skip_whitespace()
-		return tokens
+		tokenizer = cls.tokenizer(context)
+		tokenizer.feed(line)
+		return tokenizer.tokens()
 	
 	@classmethod
 	def is_incomplete(cls, line, context):
@@ -106,6 +142,13 @@ class DefaultParser:
 		except ParseError:
 			return False
 
+def _feeds(parser):
+	"""True if the lines of a command can be fed to parser.tokenizer() as they 
+	come, which gives the same tokens as parse() unless that was overridden."""
+	own = lambda name: getattr(getattr(parser, name, None), '__func__', None) is \
+		getattr(DefaultParser, name).__func__
+	return hasattr(parser, 'tokenizer') and own('parse') and own('is_incomplete')
+
 def list_commands(commands):
 	def out_fn(tokens, context):
 		"""
@@ -137,6 +180,94 @@ def console_exit(tokens, context):
 	"""This is the default quit function that comes with adso.console."""
 	raise EOFError()
 
+_escaped = re.compile(r'([ \t\n\\\'"])')
+_escape = lambda word: _escaped.sub(r'\\\1', word)
+
+class Completer:
+	"""Completes what is typed at a console when tab is pressed: the first word
+	from the names of the commands, and the other words as paths from the 
+	directory context['cwd'], if that is an adso.utils.traversible. 
+	
+	Usage: readline.set_completer(Completer(commands, context).complete)
+		readline.set_completer_delims("")
+	
+	The line is split into words by a Tokenizer rather than by readline, so 
+	that quotes and backslashes in the word being completed are understood, 
+	and the word is replaced by each completion written with backslashes. 
+	Paths are completed by traversible.complete(), which finds them by binary
+	search in each directory's sorted keys, so that completion stays instant
+	in directories with tens of thousands of entries.
+	"""
+	def __init__(self, commands, context):
+		self.commands = commands
+		self.context = context
+		self.matches = []
+		self.start = 0 # where the word being completed begins in the line
+		self.prompt = "" # the prompt, so that display() can show it again
+	
+	def candidates(self, text, first_word):
+		if first_word:
+			return sorted(_escape(name) + " " for name in self.commands if name.startswith(text))
+		cwd = self.context.get('cwd')
+		if not isinstance(cwd, traversible):
+			return []
+		return [_escape(path) + ("" if path.endswith('/') else " ") for path in cwd.complete(text)]
+	
+	@staticmethod
+	def word(line):
+		"""Returns (word, start, first_word) for the last word of `line`: its 
+		text with the quotes and backslashes taken out, where it begins, and 
+		whether it is the first word of the line."""
+		tokenizer = Tokenizer()
+		tokenizer.feed(line)
+		if tokenizer.pieces == None and not tokenizer.escaped:
+			return ("", len(line), len(tokenizer.done) == 0)
+		return ("".join(tokenizer.pieces or []), tokenizer.start, len(tokenizer.done) == 0)
+	
+	def complete(self, text, state):
+		"""The readline completer: returns the state'th way to finish `text`, 
+		which is the whole line up to the cursor, or None when there are no 
+		more."""
+		if state == 0:
+			(word, self.start, first_word) = self.word(text)
+			self.matches = [text[:self.start] + match for match in self.candidates(word, first_word)]
+		return self.matches[state] if state < len(self.matches) else None
+	
+	def display(self, substitution, matches, longest_match_length):
+		"Lists the possible completions as words, rather than as whole lines."
+		print()
+		terminal_display([match[self.start:] for match in matches])
+		print(self.prompt + readline.get_line_buffer(), end="", flush=True)
+
+def _completion(completer):
+	"""Installs a Completer, returning the readline completer and delimiters 
+	which it replaces so that they can be put back."""
+	old = (readline.get_completer(), readline.get_completer_delims())
+	readline.set_completer(completer.complete)
+	readline.set_completion_display_matches_hook(completer.display)
+	# the Completer finds the start of the word itself.
+	readline.set_completer_delims("")
+	if 'libedit' in (readline.__doc__ or ''):
+		readline.parse_and_bind("bind ^I rl_complete")
+	else:
+		readline.parse_and_bind("tab: complete")
+	return old
+
+def _defaults(commands, context, announce):
+	"Adds the built-in help and quit commands and the default prompt."
+	# We initialize some basic commands: help and quit:
+	if 'help' not in commands:
+		commands['help'] = list_commands(commands)
+		if announce:
+			print("Type 'help' for a list of commands.")
+	if 'quit' not in commands:
+		commands['quit'] = console_exit
+		if announce:
+			print("Type 'quit' to exit this prompt.")
+	# We also initialize some basic context variables:
+	if 'prompt' not in context:
+		context['prompt'] = '$'
+
 def init(commands, context={}, parser=DefaultParser):
 	"""Initializes an adso.console. 
 	
@@ -152,20 +283,21 @@ def init(commands, context={}, parser=DefaultParser):
 	as the second argument. It has one built-in key, context['prompt'], which 
 	gives the initial prompt to be echoed before the user types in a command. 
 	Finally, the parser itself appears as another optional argument.
+	
+	Where readline is available, tab completes the names of commands and, if
+	context['cwd'] is an adso.utils.traversible, paths from that directory.
 	"""
-	# We initialize some basic commands: help and quit:
-	if 'help' not in commands:
-		commands['help'] = list_commands(commands)
-		print("Type 'help' for a list of commands.")
-	if 'quit' not in commands:
-		commands['quit'] = console_exit
-		print("Type 'quit' to exit this prompt.")
-	# We also initialize some basic context variables:
-	if 'prompt' not in context:
-		context['prompt'] = '$'
+	_defaults(commands, context, announce=True)
 	# the current line, in case people want to use multi-line commands.
 	# whether a command is multi-line depends upon the parser's judgment.
+	# Parsers which keep DefaultParser's parse() are fed to their tokenizer() 
+	# a line at a time instead, so that a long command is not parsed again for
+	# each of its lines.
 	current_line = "" 
+	(tokenizer, feeds) = (None, _feeds(parser))
+	if readline != None:
+		completer = Completer(commands, context)
+		(old_completer, old_delims) = _completion(completer)
 	try: 
 		# This loop continues until an EOFError is thrown, this allows you to 
 		# use Python's Ctrl-D to exit a console. The quit() command will also
@@ -173,14 +305,28 @@ def init(commands, context={}, parser=DefaultParser):
 		while True:
 			try: 
 				# read input and enable line continuations:
-				prompt = context['prompt'] if current_line == "" else ">"
-				current_line += input(prompt + " ")
-				if parser.is_incomplete(current_line, context):
-					current_line += "\n"
-					continue
+				prompt = context['prompt'] if current_line == "" and tokenizer == None else ">"
+				if readline != None:
+					completer.prompt = prompt + " "
+				line = input(prompt + " ")
+				if feeds:
+					if tokenizer == None:
+						tokenizer = parser.tokenizer(context)
+					tokenizer.feed(line)
+					if tokenizer.incomplete:
+						tokenizer.feed("\n")
+						continue
+				else:
+					current_line += line
+					if parser.is_incomplete(current_line, context):
+						current_line += "\n"
+						continue
 				# then try to evaluate it, if there are no parsing errors:
 				try: 
-					tokens = parser.parse(current_line, context)
+					if tokenizer != None:
+						(tokens, tokenizer) = (tokenizer.tokens(), None)
+					else:
+						tokens = parser.parse(current_line, context)
 					if len(tokens) == 0:
 						current_line = ""
 						continue
@@ -192,7 +338,135 @@ def init(commands, context={}, parser=DefaultParser):
 					print("Syntax error: %s" % p)
 			except KeyboardInterrupt:
 				print("^C")
-			current_line = ""
+			(current_line, tokenizer) = ("", None)
 	except EOFError:
 		print()
 		return
+	finally:
+		if readline != None:
+			readline.set_completer(old_completer)
+			readline.set_completer_delims(old_delims)
+			readline.set_completion_display_matches_hook(None)
+
+class CommandResult:
+	"""The outcome of one command run by batch(): the line it started on, its
+	tokens (None if they could not be parsed), what the command returned, and 
+	the exception it raised, if any. status is 0 if it succeeded and 1 if not."""
+	__slots__ = ('line', 'tokens', 'output', 'error')
+	def __init__(self, line, tokens, output=None, error=None):
+		self.line = line
+		self.tokens = tokens
+		self.output = output
+		self.error = error
+	
+	@property
+	def status(self):
+		return 0 if self.error == None else 1
+	
+	def __repr__(self):
+		return "<adso.console.CommandResult(line=%d, tokens=%r, status=%d)>" % \
+			(self.line, self.tokens, self.status)
+
+def _read_commands(lines, parser, context):
+	"""Yields (line number, tokens, error) for each command in the lines, which
+	may continue over several lines just as they can at the prompt. Blank 
+	lines and comments are skipped before they are parsed, so that a quote in
+	a comment cannot run on into the lines after it."""
+	(first, current_line, tokenizer) = (None, "", None)
+	feeds = _feeds(parser)
+	for (number, line) in enumerate(lines, 1):
+		line = line.rstrip("\r\n")
+		if first == None:
+			stripped = line.lstrip()
+			if stripped == "" or stripped.startswith('#'):
+				continue
+			first = number
+		if feeds:
+			if tokenizer == None:
+				tokenizer = parser.tokenizer(context)
+			tokenizer.feed(line)
+			if tokenizer.incomplete:
+				tokenizer.feed("\n")
+				continue
+		else:
+			current_line += line
+			if parser.is_incomplete(current_line, context):
+				current_line += "\n"
+				continue
+		try:
+			tokens = tokenizer.tokens() if tokenizer != None else \
+				parser.parse(current_line, context)
+			yield (first, tokens, None)
+		except ParseError as p:
+			yield (first, None, p)
+		(first, current_line, tokenizer) = (None, "", None)
+	if first != None:
+		yield (first, None, ParseIncomplete("the script ends inside a command."))
+
+def batch(commands, source=None, context={}, parser=DefaultParser, 
+		stop_on_error=True, out=None, errors=None):
+	"""Runs the commands in a script without prompting, for bulk operations on 
+	one context (such as an unlocked password file) in a single process.
+	
+	Usage: results = batch(commands, source=None, context={}, 
+			parser=DefaultParser, stop_on_error=True, out=None, errors=None)
+		commands, context, parser: as for init().
+		source: a filename, an open file, or None to read standard input. 
+			Commands are read one per line; blank lines and lines whose 
+			first non-blank character is '#' are skipped.
+		stop_on_error: if True, stop at the first command which cannot be 
+			parsed, is not recognized or raises an exception; otherwise report
+			it and go on with the next.
+		out: where each command's result is written, by default sys.stdout. 
+			The output is collected and written in large blocks.
+		errors: where failures are reported, by default sys.stderr.
+	
+	Returns a list with a CommandResult for each command that was run, so that
+	max(r.status for r in results) is the exit status of the whole script. The
+	quit command ends the script early, as it ends a console.
+	"""
+	_defaults(commands, context, announce=False)
+	out = sys.stdout if out == None else out
+	errors = sys.stderr if errors == None else errors
+	opened = isinstance(source, str)
+	lines = open(source, 'r') if opened else sys.stdin if source == None else source
+	(buffered, results) = (io.StringIO(), [])
+	def flush():
+		out.write(buffered.getvalue())
+		buffered.seek(0)
+		buffered.truncate()
+		out.flush()
+	try:
+		for (number, tokens, error) in _read_commands(lines, parser, context):
+			if tokens != None and len(tokens) == 0:
+				continue
+			result = CommandResult(number, tokens, error=error)
+			results.append(result)
+			if error == None:
+				if tokens[0] not in commands:
+					result.error = KeyError("'%s' is not recognized as a command." % tokens[0])
+				else:
+					try:
+						result.output = commands[tokens[0]](tokens, context)
+					except EOFError:
+						break
+					except Exception as e:
+						result.error = e
+			if result.output != None:
+				buffered.write("%s\n" % (result.output,))
+				if buffered.tell() >= 65536:
+					flush()
+			if result.error != None:
+				# keep the failure next to the output of the commands before it.
+				flush()
+				message = result.error.args[0] if isinstance(result.error, KeyError) \
+					and len(result.error.args) == 1 else result.error
+				errors.write("Line %d: %s: %s\n" % (number, 
+					type(result.error).__name__, message))
+				if stop_on_error:
+					break
+	finally:
+		flush()
+		if opened:
+			lines.close()
+	return results
@@ -15,8 +15,11 @@
 #     received a copy of the license text along with adso, in a text document 
 #     named 'COPYING'. If you have not, visit http://www.gnu.org/licenses/ .
 
+import os
+import sys
 from os import urandom
-from adso.ciphers import encrypt, decrypt, supported
+from adso.ciphers import encrypt, decrypt, encryptor, decryptor, supported, prepared_key
+from adso.ciphers import decrypt_range, range_decryptors, stage, hooks
 from random import randint
 from collections import OrderedDict
 import skein
@@ -26,7 +29,17 @@ from array import array
 from datetime import datetime
 import base64
 from getpass import getpass
+from tempfile import SpooledTemporaryFile, mkstemp
 import json
+import hmac
+import mmap
+import struct
+import io
+import threading
+import asyncio
+import weakref
+from functools import partial
+from contextlib import contextmanager
 
 ## Version identifiers :: gen.syn.vers
 # Just to get out my present thinking and why there are three of them:
@@ -35,31 +48,277 @@ import json
 # The syntax number `syn` indicates that the syntax has changed, but past versions
 # are still supported within that generation. The version number `vers` indicates
 # any further change in the API or codebase. 
-__version__ = "1.0.1"
+__version__ = "1.1.1"
+# Syntax 0 is the JSON format; syntax 1 is the binary container format, 
+# syntax 2 is the sectioned binary format and syntax 3 the chunked one.
+
+def _file_version(syn):
+	"The version identifier written into files of the given syntax."
+	(gen, _, vers) = __version__.split('.')
+	return '%s.%d.%s' % (gen, syn, vers)
 
 _bytes    = lambda x: x.encode('utf-8') if type(x) == str else x
 _to_b64   = lambda x: base64.b64encode(_bytes(x)).decode('utf-8')
 _from_b64 = lambda x: base64.b64decode(_bytes(x))
 
-def _hash(message, length, pers, **kwargs):
+def _hasher(length, pers, **kwargs):
 	for key in kwargs:
 		kwargs[key] = _bytes(kwargs[key])
 	pers = b'20100914 spam@drostie.org adso/' + pers.encode('utf-8')
-	s = skein.skein512(digest_bits=length, pers=pers, **kwargs)
+	return skein.skein512(digest_bits=length, pers=pers, **kwargs)
+
+def _hash(message, length, pers, **kwargs):
+	s = _hasher(length, pers, **kwargs)
 	s.update(_bytes(message))
 	return s.digest()
 
 def _mac(message, key, nonce):
-	return _to_b64(_hash(message, 512, 'mac', mac=key, nonce=nonce))
+	with stage('mac', len(message)):
+		s = _mac_hasher(key, nonce)
+		s.update(_bytes(message))
+		return _to_b64(s.digest())
+
+def _check(key, nonce):
+	"""A short verifier of the password for a given nonce, which is stored in 
+	the header so that a wrong password is rejected before any decryption."""
+	if isinstance(key, prepared_key):
+		key = key.raw()
+	with stage('check'):
+		return _to_b64(_hash(b'', 128, 'check', mac=key, nonce=nonce))
+
+def _verify_check(data, password):
+	"""Raises PasswordIncorrect if the 'adso' section `data` has a password 
+	check which does not match. The comparison takes constant time."""
+	if 'check' in data and not hmac.compare_digest(_check(password, data['nonce']), data['check']):
+		raise PasswordIncorrect()
+
+def _mac_hasher(key, nonce):
+	"A skein object which computes _mac() of whatever is fed to its update()."
+	if isinstance(key, prepared_key):
+		key = key.raw()
+	return _hasher(512, 'mac', mac=key, nonce=nonce)
+
+# Streams are processed in chunks of this many bytes: a multiple of 3, so 
+# that base64 needs no carries, and of 64, the Threefish block size.
+_chunk = 3 * 2**16
+
+def _chunked(pieces, size=_chunk):
+	"Joins an iterable of small strings into UTF-8 chunks of about `size` bytes."
+	buf, n = [], 0
+	for piece in pieces:
+		buf.append(piece)
+		n += len(piece)
+		if n >= size:
+			yield "".join(buf).encode('utf-8')
+			buf, n = [], 0
+	if n > 0:
+		yield "".join(buf).encode('utf-8')
+
+## Trees of mappings
+# Any object with keys() and __getitem__, such as an adso.utils.traversible, 
+# may be stored as data. json asks _json_level() for such an object one level 
+# at a time, so that a tree is never copied as a whole before it is written; 
+# with _encoder.iterencode() its JSON is produced a fragment at a time.
+def _json_level(o):
+	if hasattr(o, '_shallow_dict'):
+		return o._shallow_dict()
+	elif hasattr(o, 'keys'):
+		return dict((k, o[k]) for k in o.keys())
+	raise TypeError('Object of type %s is not JSON serializable' % type(o).__name__)
+
+_dumps = lambda o: json.dumps(o, default=_json_level)
+_encoder = json.JSONEncoder(default=_json_level)
+
+def _top_level(data, where):
+	"The top level of `data` as a dict, for the formats which store each key apart."
+	if isinstance(data, dict):
+		return data
+	elif hasattr(data, 'keys'):
+		return _json_level(data)
+	raise ValueError('Only a dict can be stored in %s.' % where)
+
+def _b64_chunks(chunks):
+	"Base64-encodes an iterable of byte strings as one continuous string."
+	rest = b''
+	for chunk in chunks:
+		chunk = rest + chunk
+		n = len(chunk) - len(chunk) % 3
+		rest = chunk[n:]
+		if n > 0:
+			with stage('base64', n):
+				text = _to_b64(chunk[:n])
+			yield text
+	if len(rest) > 0:
+		with stage('base64', len(rest)):
+			text = _to_b64(rest)
+		yield text
+
+## The adso PRNG
+# Each thread keeps its own 512-bit state, seeded from urandom(), so threads 
+# never wait on each other or share a state. Every output also hashes in the 
+# process ID, thread ID and a per-thread counter, so that neither a forked 
+# child (which inherits the parent's states) nor a coarse clock can make two 
+# calls hash the same input.
+class _prng_state(threading.local):
+	def __init__(self):
+		self.state = urandom(64)
+		self.count = 0
+
+__prng = _prng_state()
+
+def _random_bytes(bits):
+	"Returns `bits` random bits (rounded up to whole bytes) and reseeds."
+	prng = __prng
+	prng.count += 1
+	nonce = "atime:%r,systime:%r,pid:%d,thread:%d,count:%d" % (time.perf_counter(), 
+		time.time(), os.getpid(), threading.get_ident(), prng.count)
+	h = _hash(prng.state, 512 + bits, 'randstring', nonce=nonce)
+	prng.state = h[0:64]
+	return h[64:]
 
-__prng_state = urandom(64)
 def randstring(bits):
 	"Produces a random base64-encoded string with the adso PRNG."
-	global __prng_state
-	nonce = "atime:" + str(time.clock()) + ",systime:" + str(time.time())
-	h = _hash(__prng_state, 512 + bits, 'randstring', nonce=nonce)
-	__prng_state = h[0:64]
-	return _to_b64(h[64:])
+	with stage('randstring', bits // 8):
+		return _to_b64(_random_bytes(bits))
+
+def randstrings(bits, count):
+	"""Produces a list of `count` random base64-encoded strings of `bits` bits
+	each, all taken from a single output of the adso PRNG."""
+	size = (bits + 7) // 8
+	with stage('randstring', size * count):
+		out = _random_bytes(8 * size * count) if count > 0 else b''
+		return [_to_b64(out[i : i + size]) for i in range(0, size * count, size)]
+
+_password_chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+def randpasswords(count, length=16, chars=_password_chars):
+	"""Produces a list of `count` random passwords, each of `length` characters
+	chosen uniformly from `chars` with the adso PRNG."""
+	if not 0 < len(chars) <= 256:
+		raise ValueError('Passwords must be made from 1 to 256 characters.')
+	# bytes at or above `limit` are rejected so that every char is equally likely.
+	(n, need) = (len(chars), count * length)
+	limit = 256 - 256 % n
+	picked = []
+	while len(picked) < need:
+		# ask for enough bytes that one round almost always suffices.
+		wanted = (need - len(picked)) * 257 // limit + 16
+		picked.extend(chars[b % n] for b in _random_bytes(8 * wanted) if b < limit)
+	picked = "".join(picked[:need])
+	return [picked[i : i + length] for i in range(0, need, length)]
+
+def randpassword(length=16, chars=_password_chars):
+	"Produces a random password; see randpasswords()."
+	return randpasswords(1, length, chars)[0]
+
+class timings:
+	"""Totals of the time spent in each stage of encryption and decryption.
+	
+	Usage: with timings() as t: 
+			obj.to_dict()
+		print(t.stats())
+	
+	While it is running, a timings object receives every stage recorded with 
+	adso.ciphers.stage -- 'to_dict', 'from_dict', 'json.dumps', 'json.loads', 
+	'pad', 'randstring', 'check', 'derive_key', 'encrypt', 'decrypt', 'mac' and 
+	'base64' -- from every thread. stats() returns a dict mapping each stage 
+	name to a dict of its number of calls, total seconds and total bytes. 
+	Stages nest, so 'to_dict' includes the time of all of its parts. to_file()
+	and from_file() record the same stages a chunk at a time, so there they 
+	have a call for each chunk. Instead of `with`, start() and stop() may be 
+	called directly; reset() clears the totals.
+	
+	Other functions of (name, seconds, size) may be registered with add_hook()
+	to export each measurement as it happens.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.totals = {}
+	
+	def __call__(self, name, seconds, size):
+		with self.lock:
+			if name not in self.totals:
+				self.totals[name] = [0, 0.0, 0]
+			total = self.totals[name]
+			total[0] += 1
+			total[1] += seconds
+			total[2] += size
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, *exc_info):
+		self.stop()
+	
+	def start(self):
+		add_hook(self)
+		return self
+	
+	def stop(self):
+		remove_hook(self)
+	
+	def reset(self):
+		with self.lock:
+			self.totals = {}
+	
+	def stats(self):
+		with self.lock:
+			return dict((name, {'calls': t[0], 'seconds': t[1], 'bytes': t[2]}) \
+				for (name, t) in self.totals.items())
+
+def add_hook(fn):
+	"Calls fn(name, seconds, size) whenever an instrumented stage finishes."
+	if fn not in hooks:
+		hooks.append(fn)
+
+def remove_hook(fn):
+	if fn in hooks:
+		hooks.remove(fn)
+
+## asyncio support
+# The async methods run their blocking work -- the file I/O as well as the 
+# cryptography -- in an executor, by default the event loop's own thread pool.
+# At most `async_limit` of them run at once in each event loop; the others 
+# wait for a free slot without blocking the loop.
+async_limit = 8
+_async_slots = weakref.WeakKeyDictionary()
+
+async def _in_executor(executor, fn):
+	loop = asyncio.get_running_loop()
+	(limit, slots) = _async_slots.get(loop, (None, None))
+	if limit != async_limit:
+		slots = asyncio.Semaphore(async_limit)
+		_async_slots[loop] = (async_limit, slots)
+	async with slots:
+		return await loop.run_in_executor(executor, fn)
+
+@contextmanager
+def _replacing(filename, mode):
+	"""Opens a temporary file beside `filename` which, if the block finishes 
+	without an error, is synced to disk and then renamed over `filename`. A 
+	crash at any point leaves either the old file or the new one, never a mix.
+	The file keeps the permissions of the one it replaces; new files are 0600."""
+	(folder, name) = os.path.split(os.path.abspath(filename))
+	(fd, temp) = mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=folder)
+	try:
+		with os.fdopen(fd, mode) as f:
+			if os.path.exists(filename):
+				os.chmod(temp, os.stat(filename).st_mode & 0o7777)
+			yield f
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temp, filename)
+	except BaseException:
+		if os.path.exists(temp):
+			os.unlink(temp)
+		raise
+	# the rename itself is only durable once the directory is synced.
+	if hasattr(os, 'O_DIRECTORY'):
+		fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
 
 class adsoSyntaxError(ValueError):
 	def __init__(self, message, data):
@@ -74,12 +333,384 @@ class PasswordIncorrect(ValueError):
 	def __str__(self):
 		return repr(self.message)
 
+class SavesFailed(Exception):
+	"""Raised by flush() when more than one background save has failed; 
+	`errors` is the list of (filename, exception) pairs."""
+	def __init__(self, errors):
+		self.errors = errors
+		self.message = "%d background saves failed: %s" % (len(errors), 
+			"; ".join("'%s': %s" % (filename, e) for (filename, e) in errors))
+	def __str__(self):
+		return repr(self.message)
+
 class PasswordUnavailable(ValueError):
 	def __init__(self):
 		self.message = "No password was available to do the encryption/decryption."
 	def __str__(self):
 		return repr(self.message)
 
+def _get_password(password, prompts):
+	if isinstance(password, Session):
+		password = password.key
+	if isinstance(password, prepared_key) and password.key == None:
+		raise PasswordUnavailable()
+	if password != None:
+		return password
+	elif prompts: 
+		return getpass('Please provide the password for this adso object: ')
+	else:
+		raise PasswordUnavailable()
+
+def _syntax(data, source):
+	"""Checks the version identifier of the 'adso' section `data` of `source`, 
+	returning the syntax number if it belongs to this generation."""
+	if 'version' not in data:
+		raise adsoSyntaxError('No version identifier', source)
+	
+	version_split = lambda s: map(int, s.split("."))
+	refgen = version_split(__version__).__next__()
+	try:
+		(gen, syn, vers) = version_split(data['version'])
+	except ValueError:
+		raise adsoSyntaxError('Invalid version identifier', source)
+	if gen != refgen:
+		raise adsoSyntaxError('Expected version %s.x.y, instead saw %s' % (refgen, data['version']), source)
+	return syn
+
+class _envelope_reader:
+	"""Reads the JSON envelope of an adso file incrementally.
+	
+	Every value in the envelope is parsed with the json module, except the 
+	"crypt" string, which may be arbitrarily large: it is passed a piece at a 
+	time to a callback (or spooled to a temporary file) and never kept whole.
+	
+	"""
+	_ws = ' \t\n\r'
+	
+	def __init__(self, fileobj, progress=None):
+		self.fileobj = fileobj
+		self.progress = progress
+		self.buf = ""
+		self.at = 0
+		self.read_chars = 0
+		self.eof = False
+		self.spool = None
+		self.decoder = json.JSONDecoder()
+	
+	def fill(self):
+		if self.eof:
+			raise adsoSyntaxError('Unexpected end of file', None)
+		text = self.fileobj.read(_chunk)
+		if len(text) == 0:
+			self.eof = True
+		self.buf = self.buf[self.at:] + text
+		self.at = 0
+		self.read_chars += len(text)
+		if self.progress != None:
+			self.progress(self.read_chars)
+	
+	def peek(self):
+		while True:
+			while self.at < len(self.buf) and self.buf[self.at] in self._ws:
+				self.at += 1
+			if self.at < len(self.buf):
+				return self.buf[self.at]
+			self.fill()
+	
+	def expect(self, chars):
+		char = self.peek()
+		if char not in chars:
+			raise adsoSyntaxError('Not a JSON string', None)
+		self.at += 1
+		return char
+	
+	def value(self):
+		self.peek()
+		while True:
+			try:
+				(val, end) = self.decoder.raw_decode(self.buf, self.at)
+				# a number at the end of the buffer might continue in the file.
+				if end < len(self.buf) or self.eof:
+					self.at = end
+					return val
+			except ValueError:
+				pass
+			self.fill()
+	
+	def obj(self, on_key):
+		output = OrderedDict()
+		self.expect('{')
+		if self.peek() == '}':
+			self.at += 1
+			return output
+		while True:
+			key = self.value()
+			if type(key) != str:
+				raise adsoSyntaxError('Not a JSON string', None)
+			self.expect(':')
+			output[key] = on_key(output, key)
+			if self.expect(',}') == '}':
+				return output
+	
+	def read(self, start, feed):
+		"""Reads the envelope, returning it as a dict with an empty "crypt". If 
+		the version, cipher and nonce are known when the ciphertext begins, then 
+		start() is called with the 'adso' section so far, and feed() with pieces 
+		of the base64 text; otherwise replay() yields those pieces afterwards."""
+		def crypt(data, key):
+			if key != 'crypt':
+				return self.value()
+			self.expect('"')
+			if all(k in data for k in ('version', 'cipher', 'nonce')):
+				start(data)
+				sink = feed
+			else:
+				self.spool = SpooledTemporaryFile(max_size=_chunk * 4, mode='w+')
+				sink = self.spool.write
+			# hold back partial base64 quads so that each piece decodes alone.
+			rest = ""
+			while True:
+				end = self.buf.find('"', self.at)
+				text = rest + self.buf[self.at : len(self.buf) if end == -1 else end]
+				n = len(text) - len(text) % 4 if end == -1 else len(text)
+				sink(text[:n])
+				rest = text[n:]
+				if end != -1:
+					self.at = end + 1
+					return ""
+				self.at = len(self.buf)
+				self.fill()
+		def top(data, key):
+			return self.obj(crypt) if key == 'adso' else self.value()
+		source = self.obj(top)
+		if 'adso' not in source or type(source['adso']) != OrderedDict:
+			raise adsoSyntaxError('Not an adso object', source)
+		for key in ('cipher', 'nonce', 'crypt'):
+			if key not in source['adso']:
+				raise adsoSyntaxError('No %s specified' % key, source)
+		return source
+	
+	def replay(self):
+		if self.spool == None:
+			return
+		self.spool.seek(0)
+		while True:
+			text = self.spool.read(_chunk * 4 // 3)
+			if len(text) == 0:
+				return
+			yield text
+
+## Binary container format (syntax 1)
+# The file starts with the magic string below; the rest of the header is 
+# (all integers big-endian):
+#     gen, syn: one byte each, and vers: two bytes, as in the version string
+#     description: four-byte length, then its JSON as UTF-8
+#     last modified, cipher: one-byte length, then ASCII
+#     nonce, check, mac: one-byte length, then the raw (not base64) bytes
+# The ciphertext takes up the remainder of the file. The top bit of `vers` is 
+# not part of the version: it is set when the header has a password check. 
+# (Files from version 1.1.0 have no check, and those from 1.1.1 have one but 
+# not the flag, so a header without the flag has a check when `vers` is 1 or 
+# more; every later version sets the flag, whatever its own `vers`.)
+#
+# In the sectioned format (syntax 2) the header ends with two more eight-byte 
+# integers, the offset and length of the index within the ciphertext. Each 
+# top-level key of the data is serialized on its own and padded to a whole 
+# number of blocks, and the index, which comes last, is the JSON text
+#     {"pad": ..., "sections": [[key, offset, length, mac], ...]}
+# Each section's MAC uses the nonce "<nonce>/<offset>", while the header MAC 
+# is that of the index, so that one entry can be decrypted and checked with a 
+# cipher which can seek, without reading anything else.
+#
+# The chunked format (syntax 3) has the same header as syntax 2, but every 
+# top-level key is encrypted separately with a nonce of its own, and the index 
+# is a manifest {"pad": ..., "chunks": [[key, offset, size, nonce, mac], ...]} 
+# encrypted with the header nonce; its (offset, size) are in the header. A 
+# save appends only the chunks which changed and a new manifest, and then 
+# rewrites the header to point at it, leaving the old chunks as dead space 
+# until the file is next rewritten whole.
+_magic = b'\x89adso\r\n\x1a'
+_has_check = 0x8000
+
+def _binary_header(description, modified, cipher, nonce, check, mac, syn=1, index=(0, 0)):
+	(gen, syn, vers) = map(int, _file_version(syn).split('.'))
+	field = lambda b: struct.pack('>B', len(b)) + b
+	description = json.dumps(description, sort_keys=True).encode('utf-8')
+	return b''.join([
+		_magic, struct.pack('>BBHI', gen, syn, vers | _has_check, len(description)), 
+		description, field(modified.encode('ascii')), 
+		field(cipher.encode('ascii')), field(_from_b64(nonce)), 
+		field(_from_b64(check)), field(mac), 
+		struct.pack('>QQ', *index) if syn >= 2 else b''
+	])
+
+def _parse_binary_header(view):
+	"""Parses the header of a binary adso file, returning the same dict as 
+	the JSON format would have (minus "crypt") and the ciphertext offset."""
+	if bytes(view[0:len(_magic)]) != _magic:
+		raise adsoSyntaxError('Not a binary adso object', None)
+	at = len(_magic)
+	try:
+		(gen, syn, vers, size) = struct.unpack_from('>BBHI', view, at)
+		has_check = vers & _has_check != 0 or vers >= 1
+		vers &= ~_has_check
+		at += 8
+		description = json.loads(bytes(view[at : at + size]).decode('utf-8'))
+		at += size
+		fields = []
+		for i in range(0, 5 if has_check else 4):
+			size = view[at]
+			fields.append(bytes(view[at + 1 : at + 1 + size]))
+			at += 1 + size
+		check = fields.pop(3) if has_check else None
+		if syn >= 2:
+			fields.append(list(struct.unpack_from('>QQ', view, at)))
+			at += 16
+	except (struct.error, IndexError, ValueError):
+		raise adsoSyntaxError('Truncated or invalid binary adso header', None)
+	data = OrderedDict([
+		("version", '%d.%d.%d' % (gen, syn, vers)),
+		("cipher", fields[1].decode('ascii')),
+		("nonce", _to_b64(fields[2])),
+		("mac", _to_b64(fields[3])),
+	])
+	if check != None:
+		data["check"] = _to_b64(check)
+	if syn >= 2:
+		data["index"] = fields[4]
+	return (OrderedDict([
+		("description", description),
+		("last modified", fields[0].decode('ascii')),
+		("adso", data)
+	]), at)
+
+def _identity(f):
+	"Identifies the file which a file object has open, whatever its name now is."
+	st = os.fstat(f.fileno())
+	return (st.st_dev, st.st_ino)
+
+class _mapped_file:
+	"""The `reopen` of a file read by from_file(): a memory map of its bytes.
+	
+	The file stays open as long as this does, so that the sections of an object
+	can still be loaded after a save has replaced the file under its name; each
+	call maps the file's current size, so that appended chunks are seen too. A 
+	pickled copy, as made by open_many(processes=True), reopens the file by name
+	and refuses to read it if it is no longer the same file."""
+	def __init__(self, filename):
+		self.filename = filename
+		self.file = open(filename, "rb")
+		self.identity = _identity(self.file)
+	
+	def __getstate__(self):
+		return {'filename': self.filename, 'identity': self.identity}
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		try:
+			self.file = open(self.filename, "rb")
+		except EnvironmentError:
+			self.file = None
+		if self.file != None and _identity(self.file) != self.identity:
+			self.close()
+	
+	def close(self):
+		if self.file != None:
+			self.file.close()
+			self.file = None
+	
+	@contextmanager
+	def __call__(self):
+		if self.file == None:
+			raise EnvironmentError("'%s' has been replaced or removed since it was " \
+				"read, so its sections can no longer be loaded." % self.filename)
+		with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as m:
+			yield m
+
+class _fixed_buffer:
+	"The `reopen` of from_bytes(), which always gives the same bytes."
+	def __init__(self, source):
+		self.source = source
+	
+	@contextmanager
+	def __call__(self):
+		yield self.source
+
+class _section_reader:
+	"""Decrypts the sections of a sectioned or chunked adso file on demand.
+	
+	`reopen` is a function returning a context manager for the file's bytes, 
+	so that a file need not be kept open between loads; `at` is the offset of 
+	the ciphertext. Sections are kept once they have been decrypted.
+	
+	"""
+	def __init__(self, reopen, at, data, password, workers=None):
+		self.reopen = reopen
+		self.at = at
+		self.chunked = _syntax(data, data) == 3
+		self.cipher = data['cipher']
+		self.nonce = data['nonce']
+		self.password = password
+		self.workers = workers
+		(offset, length) = data['index']
+		if self.chunked:
+			index = self.decrypt_chunk(offset, length, self.nonce)
+		else:
+			index = self.decrypt(offset, length)
+		if _mac(index, password, self.nonce) != data['mac']:
+			raise PasswordIncorrect()
+		with stage('json.loads', len(index)):
+			index = json.loads(index.decode('utf-8'))
+		self.index = OrderedDict((s[0], s[1:]) for s in \
+			index['chunks' if self.chunked else 'sections'])
+		self.loaded = {}
+	
+	def decrypt(self, offset, length):
+		with self.reopen() as source:
+			view = memoryview(source)
+			crypt = view[self.at + offset : self.at + offset + length + (-length % 64)]
+			try:
+				with stage('decrypt', len(crypt)):
+					return decrypt_range(self.cipher, self.password, self.nonce, \
+						crypt, offset, self.workers)[:length]
+			finally:
+				crypt.release()
+				view.release()
+	
+	def decrypt_chunk(self, offset, size, nonce):
+		with self.reopen() as source:
+			view = memoryview(source)
+			crypt = view[self.at + offset : self.at + offset + size]
+			try:
+				return decrypt(self.cipher, self.password, nonce, crypt, self.workers)
+			finally:
+				crypt.release()
+				view.release()
+	
+	def keys(self):
+		return self.index.keys()
+	
+	def read(self, key):
+		if key not in self.loaded:
+			if self.chunked:
+				(offset, size, nonce, mac) = self.index[key]
+				text = self.decrypt_chunk(offset, size, nonce)
+			else:
+				(offset, length, mac) = self.index[key]
+				(text, nonce) = (self.decrypt(offset, length), '%s/%d' % (self.nonce, offset))
+			if _mac(text, self.password, nonce) != mac:
+				raise adsoSyntaxError('Corrupted section: %s' % json.dumps(key), None)
+			with stage('json.loads', len(text)):
+				self.loaded[key] = json.loads(text.decode('utf-8'))
+		return self.loaded[key]
+	
+	def live_size(self):
+		"The number of bytes of ciphertext which the manifest still refers to."
+		return sum(entry[1] for entry in self.index.values())
+	
+	def read_all(self):
+		return dict((key, self.read(key)) for key in self.keys())
+
 class adso:
 	"""adso data storage objects, used to encrypt JSON-serializable data.
 	
@@ -96,9 +727,30 @@ class adso:
 			in the file as metadata to describe its purpose. Ideally, these 
 			should be defined by the applications, rather than by the users.
 			(default: "Generic adso object.")
+		workers: if set, ciphers which support it spread the encryption of 
+			large payloads across this many processes. (default: None)
+		binary: if True, to_file() writes the compact binary container format 
+			rather than JSON. Objects read from binary files keep it set.
+			(default: False)
+		sectioned: if True, to_file() writes the sectioned binary format, which 
+			stores each top-level key of `data` (which must be a dict) apart, 
+			so that load() can decrypt just one of them. Objects read from 
+			sectioned files keep it set, and only decrypt their data as it is 
+			needed. (default: False)
+		chunked: like sectioned, but each top-level key is encrypted with its 
+			own nonce, so that saving an object back to the file it was read 
+			from only re-encrypts and appends the keys which have changed.
+			(default: False)
 	
 	"""
-	def __init__(self, data={}, cipher=supported[0], password=None, prompts=True, description="Generic adso object."):
+	def __init__(self, data={}, cipher=supported[0], password=None, prompts=True, description="Generic adso object.", workers=None, binary=False, sectioned=False, chunked=False):
+		self._sections = None
+		self._stored = None
+		self._saver = None
+		self.chunked = chunked
+		self.sectioned = sectioned
+		self.binary = binary or sectioned or chunked
+		self.workers = workers
 		self.prompts = prompts
 		self.password = password
 		self.cipher = cipher
@@ -109,12 +761,166 @@ class adso:
 		return '<adso.adso(%s, cipher="%s", prompts=%s)>' % \
 			(json.dumps(self.description), self.cipher, str(self.prompts))
 	
+	@property
+	def data(self):
+		"""The encrypted data. For sectioned files, reading this decrypts every 
+		section which has not been loaded yet."""
+		if self._sections != None:
+			(self._data, self._sections) = (self._sections.read_all(), None)
+		return self._data
+	
+	@data.setter
+	def data(self, value):
+		(self._data, self._sections) = (value, None)
+	
+	def load(self, path):
+		"""Returns the value at a POSIX-style path within the data, for example 
+		obj.load('/group/site'). In a sectioned file which has not been fully 
+		decrypted, only the section holding the first component is decrypted."""
+		keys = [key for key in path.split('/') if key != '']
+		if len(keys) == 0:
+			return self.data
+		if self._sections != None:
+			value = self._sections.read(keys[0])
+		else:
+			value = self.data[keys[0]]
+		for key in keys[1:]:
+			value = value[int(key)] if isinstance(value, list) else value[key]
+		return value
+	
 	@classmethod
 	def from_file(c, filename, **kwargs):
-		"""Decrypts the given file into an adso object."""
+		"""Decrypts the given file into an adso object. Binary files are memory-
+		mapped, so that the ciphertext is handed to the cipher without copying."""
 		#We let any IOErrors propagate to the end user.
+		reopen = _mapped_file(filename)
+		try:
+			binary = reopen.file.read(len(_magic)) == _magic
+			if binary:
+				with reopen() as m:
+					out = adso._from_buffer(m, reopen, **kwargs)
+		except:
+			reopen.close()
+			raise
+		# only the sections of a sectioned or chunked file are read later.
+		if not binary or out._sections == None:
+			reopen.close()
+		if binary:
+			if out.chunked:
+				out._stored = (os.path.abspath(filename), out._sections)
+			return out
 		with open(filename, "r") as f:
-			return adso.from_string(f.read(), **kwargs)
+			return adso.from_stream(f, **kwargs)
+	
+	@classmethod
+	async def afrom_file(c, filename, executor=None, **kwargs):
+		"""The asyncio version of from_file(), which runs it in `executor` (by 
+		default, the event loop's thread pool) so that the loop is not blocked.
+		
+		Usage: obj = await adso.afrom_file(filename, password=..., prompts=False)
+		"""
+		return await _in_executor(executor, partial(adso.from_file, filename, **kwargs))
+	
+	@classmethod
+	def from_bytes(c, source, **kwargs):
+		"""Decrypts a binary adso object from any bytes-like object, such as an 
+		mmap. If given, `progress` is called with the size once it is decrypted.
+		A sectioned object keeps a reference to `source` to load sections from."""
+		return adso._from_buffer(source, _fixed_buffer(source), **kwargs)
+	
+	@classmethod
+	def _from_buffer(c, source, reopen, prompts=True, password=None, progress=None, workers=None):
+		view = memoryview(source)
+		crypt = None
+		try:
+			(header, at) = _parse_binary_header(view)
+			data = header['adso']
+			syn = _syntax(data, header)
+			if syn not in (1, 2, 3):
+				raise adsoSyntaxError('adso v. %s cannot handle syntax version: %s' % (__version__, data['version']), header)
+			password = _get_password(password, prompts)
+			_verify_check(data, password)
+			if syn == 1:
+				crypt = view[at:]
+				obj = decrypt(data['cipher'], password, data['nonce'], crypt, workers)
+		finally:
+			if crypt != None:
+				crypt.release()
+			view.release()
+		if syn >= 2:
+			sections = _section_reader(reopen, at, data, password, workers)
+		elif _mac(obj, password, data['nonce']) != data['mac']:
+			raise PasswordIncorrect()
+		else:
+			with stage('json.loads', len(obj)):
+				obj = json.loads(obj.decode('utf-8'))['data']
+		if progress != None:
+			progress(len(source))
+		out = adso(
+			data = obj if syn == 1 else None, cipher = data['cipher'], 
+			password = password, prompts = prompts, 
+			description = header['description'], workers = workers, 
+			binary = True, sectioned = syn == 2, chunked = syn == 3, 
+		)
+		if syn >= 2:
+			out._sections = sections
+		return out
+	
+	@classmethod
+	def from_stream(c, fileobj, prompts=True, password=None, progress=None, workers=None):
+		"""Decrypts an adso object from a text file object, a chunk at a time.
+		
+		The ciphertext is never held in memory as a whole: it is decoded and 
+		decrypted as it is read, whenever the version, cipher and nonce come 
+		before it in the file (as they do in files written by to_stream()), and 
+		is otherwise spooled to a temporary file until they are known. If given, 
+		`progress` is called with the number of characters read so far.
+		
+		"""
+		reader = _envelope_reader(fileobj, progress)
+		state = {}
+		def start(data):
+			syn = _syntax(data, data)
+			if syn != 0:
+				raise adsoSyntaxError('adso v. %s cannot handle syntax version: %s' % (__version__, data['version']), data)
+			state['password'] = _get_password(password, prompts)
+			_verify_check(data, state['password'])
+			state['dec'] = decryptor(data['cipher'], state['password'], data['nonce'], workers)
+			state['mac'] = _mac_hasher(state['password'], data['nonce'])
+			state['plain'] = []
+		def feed(text):
+			if len(text) == 0:
+				return
+			with stage('base64', len(text)):
+				crypt = _from_b64(text)
+			with stage('decrypt', len(crypt)):
+				out = state['dec'].update(crypt)
+			with stage('mac', len(out)):
+				state['mac'].update(out)
+			state['plain'].append(out)
+		def finish():
+			with stage('decrypt'):
+				out = state['dec'].final()
+			with stage('mac', len(out)):
+				state['mac'].update(out)
+			state['plain'].append(out)
+		source = reader.read(start, feed)
+		if 'dec' not in state:
+			start(source['adso'])
+			for text in reader.replay():
+				feed(text)
+		finish()
+		data = source['adso']
+		if _to_b64(state['mac'].digest()) != data.get('mac'):
+			raise PasswordIncorrect()
+		plain = b"".join(state['plain'])
+		with stage('json.loads', len(plain)):
+			obj = json.loads(plain.decode('utf-8'))['data']
+		return adso(
+			data = obj, cipher = data['cipher'], password = state['password'], 
+			prompts = prompts, description = source['description'], 
+			workers = workers, 
+		)
 	
 	@classmethod
 	def from_string(c, source, **kwargs):
@@ -126,83 +932,493 @@ class adso:
 		return adso.from_dict(data, **kwargs)
 	
 	@classmethod
-	def from_dict(c, source, prompts=True, password=None):
+	def from_dict(c, source, prompts=True, password=None, workers=None):
 		"""Decrypts the given Python dictionary into an adso object."""
 		# we do a bunch of quick checks to make sure that the data is ok
 		if 'adso' not in source:
 			raise adsoSyntaxError('Not an adso object', source)
 		
 		data = source['adso']
-		
-		if 'version' not in data:
-			raise adsoSyntaxError('No version identifier', source)
-		
-		version_split = lambda s: map(int, s.split("."))
-		refgen = version_split(__version__).__next__()
-		try:
-			(gen, syn, vers) = version_split(data['version'])
-		except ValueError:
-			raise adsoSyntaxError('Invalid version identifier', source)
-		if gen != refgen:
-			raise adsoSyntaxError('Expected version %s.x.y, instead saw %s' % (refgen, data['version']), source)
+		syn = _syntax(data, source)
 		
 		# Parse rules for this generation of syntax. At this point we assume
 		# that the syntax is correct and allow the user to debug whatever invalid
 		# syntax errors exist by hand. This tool should never produce them.
-		if password == None:
-			if prompts: 
-				password = getpass('Please provide the password for this adso object: ')
-			else:
-				raise PasswordUnavailable()
+		password = _get_password(password, prompts)
+		_verify_check(data, password)
 		
 		if syn == 0:
-			obj = decrypt(data['cipher'], password, data['nonce'], \
-				_from_b64(data['crypt']))
-			mac = _mac(obj, password, data['nonce'])
-			if mac != data['mac']:
-				raise PasswordIncorrect()
-			obj = json.loads(obj.decode('utf-8'))['data']
+			with stage('from_dict') as total:
+				with stage('base64', len(data['crypt'])):
+					crypt = _from_b64(data['crypt'])
+				obj = decrypt(data['cipher'], password, data['nonce'], crypt, workers)
+				mac = _mac(obj, password, data['nonce'])
+				if mac != data['mac']:
+					raise PasswordIncorrect()
+				with stage('json.loads', len(obj)):
+					obj = json.loads(obj.decode('utf-8'))['data']
+				total.size = len(crypt)
 			return adso(
 				data = obj, cipher = data['cipher'], password = password, 
 				prompts = prompts, description = source['description'], 
+				workers = workers, 
 			)
 		else:
-			raise adsoSyntaxError('adso v. %s cannot handle syntax version: %s.%s' % (__version__, gen, syn))
+			raise adsoSyntaxError('adso v. %s cannot handle syntax version: %s' % (__version__, data['version']), source)
 	
 	def to_file(self, filename):
-		"""Encrypts and serializes this object into the specified file."""
-		with open(filename, 'w') as f:
-			f.write(self.to_str())
+		"""Encrypts and serializes this object into the specified file. The file 
+		is replaced atomically. After write_behind(), this only schedules the save."""
+		if self._saver != None:
+			self._password()
+			self._saver.schedule(filename)
+			return
+		self._write(filename)
 		if self.prompts:
 			print("Saved to '%s'." % filename)
 	
+	def write_behind(self, delay=1.0, on_error=None):
+		"""Makes to_file() save in the background, `delay` seconds after it was 
+		last called, so that many saves in a row cost one encryption and write.
+		Changes made before a later to_file() are picked up by its save. 
+		flush() waits for every scheduled save; write_behind(None) flushes and 
+		returns to saving immediately.
+		
+		A save reads the data in the background, so the data must not be 
+		changed while it runs. Returns a lock which is held for each save: code
+		which changes the data while saves may be running should hold it too.
+		
+		When a save fails, on_error(filename, exception) is called from the 
+		saving thread; by default the failure is printed to stderr unless 
+		prompts is False. Either way, flush() raises it later."""
+		if self._saver != None:
+			self.flush()
+		self._saver = None if delay == None else _write_behind(self, delay, on_error)
+		return None if self._saver == None else self._saver.lock
+	
+	def flush(self):
+		"""Waits until every save scheduled with write_behind() is on disk. If 
+		a save failed, raises its error, or SavesFailed if several did."""
+		if self._saver != None:
+			self._saver.flush()
+	
+	async def ato_file(self, filename, executor=None):
+		"""The asyncio version of to_file(), which runs it in `executor` (by 
+		default, the event loop's thread pool). The object should not be changed
+		until the save has finished."""
+		await _in_executor(executor, partial(self.to_file, filename))
+	
+	def _write(self, filename):
+		if self.chunked and self._update_chunks(filename):
+			return
+		# sections still to be loaded must be read before the file is replaced.
+		self.data
+		with _replacing(filename, 'wb' if self.binary else 'w') as f:
+			if self.binary:
+				self.to_binary(f)
+			else:
+				self.to_stream(f)
+		if self.chunked:
+			self._stored = (os.path.abspath(filename), adso.from_file(filename, 
+				password=self.password, prompts=False, workers=self.workers)._sections)
+	
+	def _update_chunks(self, filename):
+		"""Saves a chunked object to the file it was read from by appending the 
+		chunks which changed and a new manifest, then rewriting the header. 
+		Returns False if the file must instead be rewritten whole: when it is 
+		another file, or the file has been replaced or saved by anything else 
+		since it was read, the password, cipher or header size has changed, or 
+		more than half of the file would be dead space."""
+		if self._stored == None or self._stored[0] != os.path.abspath(filename):
+			return False
+		stored = self._stored[1]
+		password = self._password()
+		if password != stored.password or self.cipher != stored.cipher:
+			return False
+		lazy = self._sections != None
+		data = stored.loaded if lazy else _top_level(self._data, 'chunks')
+		(entries, dirty) = (OrderedDict(), [])
+		for key in (stored.keys() if lazy else data.keys()):
+			if lazy and key not in stored.loaded:
+				entries[key] = stored.index[key]
+				continue
+			with stage('json.dumps') as s:
+				text = _dumps(data[key]).encode('utf-8')
+				s.size = len(text)
+			old = stored.index.get(key)
+			if old != None and _mac(text, password, old[2]) == old[3]:
+				entries[key] = old
+			else:
+				entries[key] = None
+				dirty.append((key, text))
+		nonce = randstring(256)
+		chunk_nonces = iter(randstrings(256, len(dirty)))
+		modified = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%fZ")
+		with open(filename, 'r+b') as f:
+			# the offsets in the index are only good for the file they were read
+			# from, as last saved through this object.
+			if stored.reopen.file == None or _identity(f) != stored.reopen.identity:
+				return False
+			try:
+				(header, at) = _parse_binary_header(f.read(stored.at))
+			except adsoSyntaxError:
+				return False
+			if at != stored.at or header['adso']['nonce'] != stored.nonce:
+				return False
+			end = f.seek(0, 2) - stored.at
+			if end > 2 * (stored.live_size() + sum(len(t) for (k, t) in dirty)) + _chunk:
+				return False
+			for (key, text) in dirty:
+				chunk_nonce = next(chunk_nonces)
+				crypt = encrypt(self.cipher, password, chunk_nonce, text, self.workers)
+				f.write(crypt)
+				entries[key] = [end, len(crypt), chunk_nonce, _mac(text, password, chunk_nonce)]
+				end += len(crypt)
+			(crypt, mac) = self._manifest(password, nonce, entries)
+			header = _binary_header(self.description, modified, self.cipher, 
+				nonce, _check(password, nonce), _from_b64(mac), 3, (end, len(crypt)))
+			if len(header) != stored.at:
+				return False
+			f.write(crypt)
+			f.flush()
+			os.fsync(f.fileno())
+			# the old manifest stays valid until this point.
+			f.seek(0)
+			f.write(header)
+			f.flush()
+			os.fsync(f.fileno())
+		(stored.index, stored.nonce) = (entries, nonce)
+		return True
+	
+	def _manifest(self, password, nonce, entries):
+		"Returns the encrypted manifest of a chunked file, and its MAC."
+		pad = "".join(map(lambda x: str(x % 10), range(0, randint(0, 500))))
+		chunks = [[key] + entry for (key, entry) in entries.items()]
+		text = json.dumps({'pad': pad, 'chunks': chunks}).encode('utf-8')
+		return (encrypt(self.cipher, password, nonce, text, self.workers), 
+			_mac(text, password, nonce))
+	
+	def _chunk_chunks(self, password, nonce, mac, progress, index):
+		"""Yields the ciphertext of the chunked format: each top-level key of 
+		the data encrypted with a nonce of its own, then the manifest, whose 
+		MAC is copied into `mac` and [offset, size] into `index`."""
+		data = _top_level(self.data, 'chunks')
+		(entries, offset) = (OrderedDict(), 0)
+		chunk_nonces = iter(randstrings(256, len(data)))
+		for key in data:
+			with stage('json.dumps') as s:
+				text = _dumps(data[key]).encode('utf-8')
+				s.size = len(text)
+			chunk_nonce = next(chunk_nonces)
+			crypt = encrypt(self.cipher, password, chunk_nonce, text, self.workers)
+			entries[key] = [offset, len(crypt), chunk_nonce, _mac(text, password, chunk_nonce)]
+			yield crypt
+			offset += len(crypt)
+			if progress != None:
+				progress(offset)
+		(crypt, digest) = self._manifest(password, nonce, entries)
+		mac[:] = [digest]
+		index[:] = [offset, len(crypt)]
+		yield crypt
+	
+	def _crypt_chunks(self, password, nonce, mac, progress):
+		"""Yields the ciphertext of this object a chunk at a time, feeding the 
+		plaintext to the skein object `mac` as it goes."""
+		# include a padding string to disguise length changes in the document.
+		pad = "".join(map(lambda x: str(x % 10), range(0, randint(0, 500))))
+		chunks = _chunked(_encoder.iterencode({'pad': pad, 'data': self.data}))
+		enc = encryptor(self.cipher, password, nonce, self.workers)
+		done = 0
+		while True:
+			# the JSON is produced lazily, so it is timed as each chunk is taken.
+			with stage('json.dumps') as s:
+				chunk = next(chunks, None)
+				s.size = 0 if chunk == None else len(chunk)
+			if chunk == None:
+				break
+			with stage('mac', len(chunk)):
+				mac.update(chunk)
+			with stage('encrypt', len(chunk)):
+				crypt = enc.update(chunk)
+			yield crypt
+			done += len(chunk)
+			if progress != None:
+				progress(done)
+		with stage('encrypt'):
+			crypt = enc.final()
+		yield crypt
+	
+	def _section_chunks(self, password, nonce, mac, progress, index):
+		"""Yields the ciphertext of the sectioned format: each top-level key of 
+		the data padded to whole blocks, then the index. The index is fed to 
+		`mac`, and its [offset, length] is stored into the list `index`."""
+		data = _top_level(self.data, 'sections')
+		if self.cipher not in range_decryptors:
+			raise ValueError('Cipher "%s" cannot be used for sections.' % self.cipher)
+		enc = encryptor(self.cipher, password, nonce, self.workers)
+		(sections, offset) = ([], 0)
+		for key in data:
+			with stage('json.dumps') as s:
+				text = _dumps(data[key]).encode('utf-8')
+				s.size = len(text)
+			sections.append([key, offset, len(text), \
+				_mac(text, password, '%s/%d' % (nonce, offset))])
+			text += b' ' * (-len(text) % 64)
+			with stage('encrypt', len(text)):
+				crypt = enc.update(text)
+			yield crypt
+			offset += len(text)
+			if progress != None:
+				progress(offset)
+		pad = "".join(map(lambda x: str(x % 10), range(0, randint(0, 500))))
+		text = json.dumps({'pad': pad, 'sections': sections}).encode('utf-8')
+		with stage('mac', len(text)):
+			mac.update(text)
+		index[:] = [offset, len(text)]
+		with stage('encrypt', len(text)):
+			crypt = enc.update(text) + enc.final()
+		yield crypt
+	
+	def to_binary(self, fileobj, progress=None):
+		"""Encrypts and serializes this object into a binary file object, in the 
+		compact container format, or the sectioned or chunked format if one of 
+		those is set. The ciphertext is written a chunk at a time, and the MAC 
+		is filled in at the end, so `fileobj` must be seekable. If given, 
+		`progress` is called as for to_stream()."""
+		password = self._password()
+		nonce = randstring(256)
+		mac = _mac_hasher(password, nonce)
+		modified = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%fZ")
+		syn = 3 if self.chunked else 2 if self.sectioned else 1
+		header = _binary_header(self.description, modified, self.cipher, nonce, 
+			_check(password, nonce), bytes(64), syn)
+		mac_at = fileobj.tell() + len(header) - (80 if syn >= 2 else 64)
+		fileobj.write(header)
+		index = []
+		if self.chunked:
+			mac = []
+			chunks = self._chunk_chunks(password, nonce, mac, progress, index)
+		elif self.sectioned:
+			chunks = self._section_chunks(password, nonce, mac, progress, index)
+		else:
+			chunks = self._crypt_chunks(password, nonce, mac, progress)
+		for chunk in chunks:
+			fileobj.write(chunk)
+		end = fileobj.tell()
+		fileobj.seek(mac_at)
+		fileobj.write(_from_b64(mac[0]) if self.chunked else mac.digest())
+		if syn >= 2:
+			fileobj.write(struct.pack('>QQ', *index))
+		fileobj.seek(end)
+	
+	def to_bytes(self):
+		"""Encrypts and serializes this object into the binary container format."""
+		f = io.BytesIO()
+		self.to_binary(f)
+		return f.getvalue()
+	
+	def to_stream(self, fileobj, progress=None):
+		"""Encrypts and serializes this object into a text file object.
+		
+		The JSON text of the data is generated, MACed, encrypted and base64-
+		encoded a chunk at a time, so that only one chunk of each is in memory 
+		at once. The output is the same JSON structure as to_str(), except that 
+		the nonce precedes the ciphertext so that from_stream() can decrypt it in 
+		a single pass. If given, `progress` is called with the number of bytes of 
+		JSON text encrypted so far.
+		
+		"""
+		password = self._password()
+		nonce = randstring(256)
+		mac = _mac_hasher(password, nonce)
+		crypt = self._crypt_chunks(password, nonce, mac, progress)
+		
+		description = json.dumps(self.description, sort_keys=True, indent=4)
+		fileobj.write('{\n    "description": %s,\n    "last modified": "%s",\n' % \
+			(description.replace('\n', '\n    '), 
+			datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%fZ")))
+		fileobj.write('    "adso": {\n        "version": "%s",\n        "cipher": %s,' \
+			'\n        "nonce": "%s",\n        "check": "%s",\n        "crypt": "' % \
+			(_file_version(0), json.dumps(self.cipher), nonce, _check(password, nonce)))
+		for text in _b64_chunks(crypt):
+			fileobj.write(text)
+		fileobj.write('",\n        "mac": "%s"\n    }\n}' % _to_b64(mac.digest()))
+	
+	def _password(self):
+		self.password = _get_password(self.password, self.prompts)
+		return self.password
+	
 	def to_str(self):
 		"""Encrypts and serializes this object into a string."""
 		return json.dumps(self.to_dict(), sort_keys=True, indent=4)
 	
 	def to_dict(self):
 		"""Encrypts and serializes this object into a dictionary."""
-		if self.password != None:
-			password = self.password
-		elif self.prompts: 
-			password = getpass('Please provide the password for this adso object: ')
-		else:
-			raise PasswordUnavailable()
-		self.password = password
+		password = self._password()
 		
-		nonce = randstring(256)
-		# include a padding string to disguise length changes in the document.
-		pad = "".join(map(lambda x: str(x % 10), range(0, randint(0, 500))))
-		core = json.dumps({'pad': pad, 'data': self.data})
+		with stage('to_dict') as total:
+			nonce = randstring(256)
+			# include a padding string to disguise length changes in the document.
+			with stage('pad'):
+				pad = "".join(map(lambda x: str(x % 10), range(0, randint(0, 500))))
+			with stage('json.dumps') as s:
+				core = _dumps({'pad': pad, 'data': self.data}).encode('utf-8')
+				s.size = len(core)
+			(check, mac) = (_check(password, nonce), _mac(core, password, nonce))
+			crypt = encrypt(self.cipher, password, nonce, core, self.workers)
+			with stage('base64', len(crypt)):
+				crypt = _to_b64(crypt)
+			total.size = len(core)
 		
 		return OrderedDict([
 			("description", self.description),
 			("last modified", datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%fZ")),
 			("adso", OrderedDict([
-				("version", __version__),
+				("version", _file_version(0)),
 				("cipher", self.cipher),
 				("nonce", nonce),
-				("mac", _mac(core, password, nonce)),
-				("crypt", _to_b64(encrypt(self.cipher, password, nonce, core)))
+				("check", check),
+				("mac", mac),
+				("crypt", crypt)
 			]))
 		])
+
+class _write_behind:
+	"""The background saver of an adso object; see adso.write_behind(). Its 
+	thread only runs while saves are pending, and is not a daemon, so pending 
+	saves still finish when the program exits."""
+	def __init__(self, obj, delay, on_error=None):
+		self.obj = obj
+		self.delay = delay
+		self.on_error = on_error
+		self.cond = threading.Condition()
+		self.lock = threading.RLock() # held while the data is being saved
+		self.pending = OrderedDict() # filename -> time at which to save it
+		self.saving = False
+		self.thread = None
+		self.errors = [] # (filename, exception) for each failed save
+	
+	def schedule(self, filename):
+		with self.cond:
+			self.pending.pop(filename, None)
+			self.pending[filename] = time.monotonic() + self.delay
+			if self.thread == None:
+				self.thread = threading.Thread(target=self.run, name='adso write-behind')
+				self.thread.start()
+			self.cond.notify_all()
+	
+	def run(self):
+		with self.cond:
+			while len(self.pending) > 0:
+				(filename, due) = next(iter(self.pending.items()))
+				wait = due - time.monotonic()
+				if wait > 0:
+					self.cond.wait(wait)
+					continue
+				del self.pending[filename]
+				self.saving = True
+				self.cond.release()
+				try:
+					with self.lock:
+						self.obj._write(filename)
+					error = None
+				except Exception as e:
+					error = e
+					self.report(filename, e)
+				finally:
+					self.cond.acquire()
+					self.saving = False
+				if error != None:
+					self.errors.append((filename, error))
+				elif self.obj.prompts and filename not in self.pending:
+					print("Saved to '%s'." % filename)
+				self.cond.notify_all()
+			self.thread = None
+	
+	def flush(self):
+		with self.cond:
+			for filename in self.pending:
+				self.pending[filename] = 0
+			self.cond.notify_all()
+			while len(self.pending) > 0 or self.saving:
+				self.cond.wait()
+			(errors, self.errors) = (self.errors, [])
+		if len(errors) == 1:
+			raise errors[0][1]
+		elif len(errors) > 1:
+			raise SavesFailed(errors)
+	
+	def report(self, filename, error):
+		"""Tells of a failed save as soon as it happens, so that it is not lost
+		if the program ends without calling flush()."""
+		if self.on_error != None:
+			try:
+				self.on_error(filename, error)
+				return
+			except Exception as e:
+				error = "%s (and on_error failed: %s)" % (error, e)
+		if self.on_error != None or self.obj.prompts:
+			print("Background save to '%s' failed: %s" % (filename, error), file=sys.stderr)
+
+class Session:
+	"""A password which is shared by many adso objects.
+	
+	Usage: s = Session(password, prompts)
+		password: the password for every adso object opened or saved through 
+			this session. If left blank, the user will be prompted for it once.
+		prompts: if False, turn off all prompting and status messages.
+	
+	The password-keyed Skein states are computed once and reused by every 
+	object opened or saved through the session, so that opening hundreds of 
+	archives only repeats the work which depends upon each nonce. Objects 
+	opened with a session keep using it until wipe() is called, after which 
+	they raise PasswordUnavailable. Sessions may also be used with `with`, 
+	which wipes them at the end of the block.
+	
+	"""
+	def __init__(self, password=None, prompts=True):
+		self.prompts = prompts
+		self.key = prepared_key(_get_password(password, prompts))
+	
+	def __repr__(self):
+		return '<adso.Session(%s)>' % ('wiped' if self.key.key == None else 'active')
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *exc_info):
+		self.wipe()
+	
+	def wipe(self):
+		"""Zeroes the password and forgets the keyed states."""
+		self.key.wipe()
+	
+	def adso(self, data={}, **kwargs):
+		"""Creates a new adso object which will be saved with this session."""
+		kwargs.setdefault('prompts', self.prompts)
+		return adso(data, password=self.key, **kwargs)
+	
+	def from_file(self, filename, **kwargs):
+		"""Decrypts the given file with this session. See adso.from_file()."""
+		kwargs.setdefault('prompts', self.prompts)
+		return adso.from_file(filename, password=self.key, **kwargs)
+	
+	async def afrom_file(self, filename, **kwargs):
+		"""Decrypts the given file with this session. See adso.afrom_file()."""
+		kwargs.setdefault('prompts', self.prompts)
+		return await adso.afrom_file(filename, password=self.key, **kwargs)
+	
+	def from_stream(self, fileobj, **kwargs):
+		"""Decrypts the given file object with this session."""
+		kwargs.setdefault('prompts', self.prompts)
+		return adso.from_stream(fileobj, password=self.key, **kwargs)
+	
+	def from_string(self, source, **kwargs):
+		"""Decrypts the given string with this session."""
+		kwargs.setdefault('prompts', self.prompts)
+		return adso.from_string(source, password=self.key, **kwargs)
+	
+	def from_dict(self, source, **kwargs):
+		"""Decrypts the given Python dictionary with this session."""
+		kwargs.setdefault('prompts', self.prompts)
+		return adso.from_dict(source, password=self.key, **kwargs)
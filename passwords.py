@@ -1,21 +1,275 @@
 # -*- coding: utf-8 -*-
 
-# This file is a part of adso, which uses PySkein, which is licensed under the 
-# GPL. As far as I can understand, this means that this code must also be 
-# released under the GPL. Since I don't believe in the value of copyright, I 
-# would like apologize to later users for that fact. Nonetheless: 
-# 
+# This file is a part of adso, which uses PySkein, which is licensed under the
+# GPL. As far as I can understand, this means that this code must also be
+# released under the GPL. Since I don't believe in the value of copyright, I
+# would like apologize to later users for that fact. Nonetheless:
+#
 #     Copyright 2010 Chris Drost
-#     
-#     adso is free software: it can be redistributed and modified under the 
-#     terms of the GNU General Public License, version 3, as published by the 
-#     Free Software Foundation. adso is distributed WITHOUT ANY WARRANTIES; 
-#     this includes the implied warranties of MERCHANTABILITY and FITNESS FOR A 
-#     PARTICULAR PURPOSE. See the license for more details. You should have 
-#     received a copy of the license text along with adso, in a text document 
+#
+#     adso is free software: it can be redistributed and modified under the
+#     terms of the GNU General Public License, version 3, as published by the
+#     Free Software Foundation. adso is distributed WITHOUT ANY WARRANTIES;
+#     this includes the implied warranties of MERCHANTABILITY and FITNESS FOR A
+#     PARTICULAR PURPOSE. See the license for more details. You should have
+#     received a copy of the license text along with adso, in a text document
 #     named 'COPYING'. If you have not, visit http://www.gnu.org/licenses/ .
 
-#from adso.core import adso
-#from adso.utils import lmap, terminal_display, traversible
+from adso.core import adso, randpassword
+from collections import OrderedDict
+from getpass import getpass
+import os
+import re
+import shutil
+import subprocess
 
+# The fields of an entry which grep() searches. An entry's site is its group
+# unless it has a site of its own.
+_fields = ('group', 'site', 'user', 'tags')
+_word = re.compile(r'\w+')
 
+def _texts(fields):
+	return [str(fields[name]).lower() for name in _fields if fields.get(name) != None]
+
+def _trigrams(text):
+	return set(text[i : i + 3] for i in range(0, len(text) - 2))
+
+class _index:
+	"""An inverted index from the words and trigrams of entries' fields to the
+	set of their ids, which is kept up to date as entries come and go.
+
+	search(word) returns a set of ids which includes every entry with `word` in
+	one of its fields, or None if the index cannot narrow it down; the ids in
+	it must still be checked with matches()."""
+	def __init__(self):
+		self.words = {}
+		self.grams = {}
+
+	def _postings(self, fields):
+		for text in _texts(fields):
+			for word in _word.findall(text):
+				yield (self.words, word)
+			for gram in _trigrams(text):
+				yield (self.grams, gram)
+
+	def add(self, id, fields):
+		for (table, key) in self._postings(fields):
+			if key in table:
+				table[key].add(id)
+			else:
+				table[key] = {id}
+
+	def remove(self, id, fields):
+		for (table, key) in self._postings(fields):
+			ids = table.get(key)
+			if ids != None:
+				ids.discard(id)
+				if len(ids) == 0:
+					del table[key]
+
+	def search(self, word):
+		if len(word) >= 3:
+			# every trigram of the word must be in the entry; smallest sets first.
+			postings = sorted((self.grams.get(gram, set()) for gram in _trigrams(word)), key=len)
+			out = set(postings[0])
+			for ids in postings[1:]:
+				out &= ids
+			return out
+		elif _word.fullmatch(word):
+			# a short word must lie within one of the indexed words.
+			out = set()
+			for (key, ids) in self.words.items():
+				if word in key:
+					out |= ids
+			return out
+		return None
+
+	@staticmethod
+	def matches(word, fields):
+		return any(word in text for text in _texts(fields))
+
+_clipboards = [['pbcopy'], ['xclip', '-selection', 'clipboard'],
+	['xsel', '--clipboard', '--input'], ['clip']]
+
+def _clipboard(text):
+	for command in _clipboards:
+		if shutil.which(command[0]) != None:
+			subprocess.run(command, input=text.encode('utf-8'), check=True)
+			return
+	raise EnvironmentError('No clipboard program (%s) was found.' % \
+		', '.join(command[0] for command in _clipboards))
+
+class entry:
+	"""One password in a pwfile. The fields are available as attributes, such as
+	e.group or e.user; copy() copies the password itself to the clipboard."""
+	def __init__(self, pwfile, id):
+		self.pwfile = pwfile
+		self.id = id
+
+	@property
+	def fields(self):
+		return self.pwfile._fields_of(self.id)
+
+	def __getattr__(self, name):
+		if name.startswith('_') or name in ('pwfile', 'id'):
+			raise AttributeError(name)
+		fields = self.fields
+		if name == 'site' and fields.get('site') == None:
+			return fields.get('group')
+		return fields.get(name)
+
+	def copy(self):
+		_clipboard(self.fields['password'])
+		self.pwfile._say("Password for site '%s', user '%s' copied to clipboard." % (self.site, self.user))
+
+	def delete(self):
+		self.pwfile.delete(self)
+
+	def undelete(self):
+		self.pwfile.undelete(self)
+
+	def __repr__(self):
+		return "<adso.passwords.entry(site=%r, user=%r, tags=%r)>" % (self.site, self.user, self.tags)
+
+class matches:
+	"""The entries found by pwfile.grep(), in the order they were added. They
+	can be indexed like a list, and narrowed further with grep()."""
+	def __init__(self, pwfile, ids):
+		self.pwfile = pwfile
+		self.ids = ids
+		self._sorted = None
+
+	def grep(self, query):
+		return self.pwfile.grep(query, self)
+
+	def _list(self):
+		if self._sorted == None:
+			self._sorted = sorted(self.ids)
+		return self._sorted
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __getitem__(self, i):
+		return entry(self.pwfile, self._list()[i])
+
+	def __iter__(self):
+		return (entry(self.pwfile, id) for id in self._list())
+
+	def __repr__(self):
+		return "\n".join("%d: %r" % (i, e) for (i, e) in enumerate(self)) or "<no matches>"
+
+class pwfile:
+	"""A password archive, which is an encrypted adso file of entries, each with
+	a group (usually the site), user, tags and password.
+
+	Usage: p = pwfile(filename, password=None, prompts=True, **kwargs)
+		filename: the file to read, which is created by save() if it does not
+			exist. kwargs go to the adso object of a new file.
+		password: the master password. If left blank, the user is prompted.
+		prompts: if False, turn off all prompting and status messages.
+
+	Then p.grep('drostie.org').grep('email')[0].copy() copies the password of
+	the first entry with both strings in its group, site, user or tags;
+	p.add(group=..., user=..., tags=..., password=...) adds an entry,
+	p.grep(...)[0].delete() moves one to the deletion queue, and p.save()
+	writes the file. grep() is case-insensitive, and is answered from an index
+	of the words and trigrams of every entry, which add(), delete() and
+	undelete() keep up to date.
+	"""
+	def __init__(self, filename, password=None, prompts=True, **kwargs):
+		self.filename = filename
+		self.prompts = prompts
+		if password == None and prompts:
+			password = getpass('Please input the master password for this file: ')
+		if os.path.exists(filename):
+			self.obj = adso.from_file(filename, password=password, prompts=False)
+			self._say("Password OK.")
+		else:
+			kwargs.setdefault('description', 'adso password file.')
+			self.obj = adso({}, password=password, prompts=False, **kwargs)
+			self._say("New password file; it will be created by .save().")
+		data = self.obj.data
+		(self.live, self.deleted, self.index) = (OrderedDict(), OrderedDict(), _index())
+		self.next_id = 0
+		for fields in data.get('entries', []):
+			self._insert(self.live, fields)
+		for fields in data.get('deleted', []):
+			self._insert(self.deleted, fields)
+
+	def _say(self, message):
+		if self.prompts:
+			print(message)
+
+	def _insert(self, table, fields):
+		(id, self.next_id) = (self.next_id, self.next_id + 1)
+		table[id] = fields
+		if table is self.live:
+			self.index.add(id, fields)
+		return id
+
+	def _fields_of(self, id):
+		return self.live[id] if id in self.live else self.deleted[id]
+
+	def __len__(self):
+		return len(self.live)
+
+	def grep(self, query, within=None):
+		"""Returns the entries which contain every word of the query in their
+		group, site, user or tags. `within` limits the search to earlier matches."""
+		# earlier matches may hold entries which have been deleted since.
+		ids = None if within == None else set(id for id in within.ids if id in self.live)
+		for word in query.lower().split():
+			found = self.index.search(word)
+			if found == None:
+				found = self.live.keys() if ids == None else ids
+			elif ids != None:
+				found = found & ids if len(found) < len(ids) else ids & found
+			ids = set(id for id in found if _index.matches(word, self.live[id]))
+		return matches(self, set(self.live) if ids == None else ids)
+
+	def add(self, group, user, tags='', password=None, **fields):
+		"""Adds an entry, with a random password unless one is given. Any other
+		keyword arguments, such as site=..., are stored in the entry too."""
+		fields.update(group=group, user=user, tags=tags)
+		fields['password'] = randpassword() if password == None else password
+		e = entry(self, self._insert(self.live, fields))
+		self._say("New password added. Don't forget to .save() !")
+		return e
+
+	def delete(self, e):
+		"Moves an entry into the deletion queue, from which undelete() restores it."
+		fields = self.live.pop(e.id)
+		self.index.remove(e.id, fields)
+		self.deleted[e.id] = fields
+		self._say("Password for site '%s', user '%s' moved into the deletion queue.\n"
+			"See .undelete(). Don't forget to .save() !" % (e.site, e.user))
+
+	def undelete(self, e=None):
+		"Restores an entry from the deletion queue; by default the last one deleted."
+		if e == None:
+			if len(self.deleted) == 0:
+				raise KeyError('The deletion queue is empty.')
+			e = entry(self, next(reversed(self.deleted)))
+		fields = self.deleted.pop(e.id)
+		self.live[e.id] = fields
+		self.index.add(e.id, fields)
+		self._say("Password for site '%s', user '%s' restored. Don't forget to .save() !" % (e.site, e.user))
+		return e
+
+	def trash(self):
+		"The entries in the deletion queue."
+		return matches(self, set(self.deleted))
+
+	def random(self, length=16):
+		"Copies a new random password to the clipboard."
+		_clipboard(randpassword(length))
+		self._say("New random password string copied to clipboard.")
+
+	def save(self):
+		self.obj.data = {
+			'entries': list(self.live.values()),
+			'deleted': list(self.deleted.values()),
+		}
+		self.obj.to_file(self.filename)
+		self._say("Password file successfully saved.")
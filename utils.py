@@ -17,49 +17,95 @@ from array import array
 from sys import stdout
 from termios import TIOCGWINSZ as window_size
 from fcntl import ioctl 
-from math import ceil
+from shutil import get_terminal_size
+import signal
+from collections import OrderedDict
+from bisect import bisect_left
+import fnmatch
 import re
 
 lmap = lambda fn, ls: list(map(fn, ls))
 
-def _terminal_width():
+# The terminal's (rows, columns), kept until a SIGWINCH says it has changed.
+_size = None
+_size_cached = None
+
+def _forget_size(previous):
+	def handler(signum, frame):
+		global _size
+		_size = None
+		if callable(previous):
+			previous(signum, frame)
+	return handler
+
+def _terminal_size():
+	global _size, _size_cached
+	if _size != None:
+		return _size
 	four_bytes = b'\x00\x00\x00\x00'
-	return array('H', ioctl(stdout, window_size, four_bytes))[1]
-
-def terminal_display(string_list):
-	w = _terminal_width()
-	def flatten(str_list, pad):
-		L = max(map(len, str_list)) + pad
-		for i in range(0, len(str_list)):
-			while len(str_list[i]) < L:
-				str_list[i] += " "
-		return str_list
-	
-	def arrange(cols):
-		i = 0
-		rows = lmap(lambda x: "    ", range(0, ceil(len(string_list) / cols)))
-		for string in string_list:
-			rows[i] += string
-			i = (i + 1) % len(rows)
-			if i == 0:
-				flatten(rows, 2)
-		return flatten(rows, 0)
-	
-	base = max(1, w // max(map(len, string_list)))
-	base_out = arrange(base)
-	while True:
-		if base > len(string_list):
-			print("\n".join(base_out))
-			return
-		base += 1
-		test = arrange(base)
-		if len(test[0]) > w:
-			print("\n".join(base_out))
-			return
-		else:
-			base_out = test
+	try:
+		size = tuple(array('H', ioctl(stdout, window_size, four_bytes)))
+	except (OSError, ValueError):
+		size = tuple(reversed(get_terminal_size()))
+	if _size_cached == None:
+		# the handler can only be set from the main thread.
+		try:
+			signal.signal(signal.SIGWINCH, _forget_size(signal.getsignal(signal.SIGWINCH)))
+			_size_cached = True
+		except (ValueError, AttributeError):
+			_size_cached = False
+	if _size_cached:
+		_size = size
+	return size
+
+def _terminal_width():
+	return _terminal_size()[1]
+
+def _column_widths(lengths, cols):
+	"""Returns (rows, widths) for strings of the given lengths laid out down 
+	`cols` columns. Every column but an unfilled last one has two spaces after 
+	its longest string."""
+	rows = -(-len(lengths) // cols)
+	widths = [max(lengths[i : i + rows]) + 2 for i in range(0, len(lengths), rows)]
+	if len(lengths) % rows != 0:
+		widths[-1] -= 2
+	return (rows, widths)
+
+def columns(string_list, width=None):
+	"""Yields the lines of string_list laid out in as many columns as fit in
+	`width` (by default, the terminal's width), reading down each column."""
+	if len(string_list) == 0:
+		return
+	width = _terminal_width() if width == None else width
+	lengths = lmap(len, string_list)
+	fits = lambda cols: 4 + sum(_column_widths(lengths, cols)[1]) <= width
+	# the most columns which fit, though never fewer than width // longest; 
+	# even columns of the shortest string could not fit more than `high`.
+	shortest = min(lengths)
+	low = min(max(1, width // max(lengths)), len(lengths))
+	high = max(low, min(len(lengths), (width - 4 - shortest) // (shortest + 2) + 1))
+	while low < high:
+		middle = (low + high + 1) // 2
+		(low, high) = (middle, high) if fits(middle) else (low, middle - 1)
+	(rows, widths) = _column_widths(lengths, low)
+	for r in range(0, rows):
+		line = ["    "]
+		for (c, w) in enumerate(widths):
+			i = r + c * rows
+			line.append(string_list[i].ljust(w) if i < len(string_list) else " " * w)
+		yield "".join(line)
+
+def terminal_display(string_list, page=False):
+	"""Prints string_list in columns which fit the terminal. If `page` is True, 
+	waits for Enter after each screenful; 'q' stops the listing."""
+	height = _terminal_size()[0] - 1 if page else 0
+	for (i, line) in enumerate(columns(string_list)):
+		if height > 0 and i > 0 and i % height == 0:
+			if input("-- more (Enter to continue, q to quit) --").strip().lower() == 'q':
+				return
+		print(line)
 
-def walk(tree, fn):
+def walk(tree, fn=None):
 	"""Processes every element in `tree` with `fn`, replacing it.
 	
 	This function is substantially similar to JSON "revivers", except that 
@@ -68,25 +114,202 @@ def walk(tree, fn):
 	an undefined type for this purpose: if your function returns `()` then the
 	key will be deleted.
 	
+	fn(obj, key, val) is called on the children of a dict or list before the 
+	dict or list itself, and obj[key] is only written when fn returns a 
+	different object than `val`. Deletions from a list happen after all of 
+	its items have been seen, so `key` is always the item's original index. 
+	The new tree (or None, if it was deleted) is returned.
+	
+	Without `fn`, walk() instead yields a (path, value) pair for each element,
+	parents before children, where `path` is the tuple of keys and list 
+	indices which leads to it; the whole tree has the path (). Both modes use 
+	a stack of their own, so trees of any depth may be walked.
+	
 	"""
-	def recurse(obj, key, val):
-		# first we recurse over the children of obj[key] == value:
-		if isinstance(val, dict):
-			for subkey in val:
-				recurse(val, subkey, val[subkey])
-		elif isinstance(val, list):
-			for subkey in range(0, len(list)):
-				recurse(val, subkey, val[subkey])
-		# then we replace obj[key] with fn(obj, key, val)
-		val = fn(obj, key, val)
-		if type(val) == tuple and len(val) == 0:
-			del obj[key]
-			return None
-		else:
-			obj[key] = val
-			return val
+	if fn == None:
+		return _walk_items(tree)
+	
+	def apply(obj, key, val, dead):
+		new = fn(obj, key, val)
+		if type(new) == tuple and len(new) == 0:
+			dead.append(key)
+		elif new is not val:
+			obj[key] = new
+	
+	top = {"": tree}
+	top_dead = []
+	# each frame is (obj, key, val, keys of val left to visit, keys of val to delete)
+	stack = [(top, "", tree, _child_keys(tree), [])]
+	while len(stack) > 0:
+		(obj, key, val, keys, dead) = stack[-1]
+		subkey = next(keys, _done)
+		if subkey is not _done:
+			subval = val[subkey]
+			if isinstance(subval, (dict, list)):
+				stack.append((val, subkey, subval, _child_keys(subval), []))
+			else:
+				apply(val, subkey, subval, dead)
+			continue
+		stack.pop()
+		for subkey in reversed(dead):
+			del val[subkey]
+		apply(obj, key, val, stack[-1][4] if len(stack) > 0 else top_dead)
+	return None if len(top_dead) > 0 else top[""]
+
+_done = object()
+
+def _child_keys(val):
+	if isinstance(val, dict):
+		return iter(list(val))
+	elif isinstance(val, list):
+		return iter(range(0, len(val)))
+	return iter(())
+
+def _walk_items(tree):
+	yield ((), tree)
+	# keys[i] is the key under which stack[i] was entered, and stack[0] the root.
+	(keys, stack) = ([], [_child_items(tree)])
+	while len(stack) > 0:
+		item = next(stack[-1], _done)
+		if item is _done:
+			stack.pop()
+			if len(keys) > 0:
+				keys.pop()
+			continue
+		(key, val) = item
+		yield (tuple(keys) + (key,), val)
+		if isinstance(val, (dict, list)):
+			keys.append(key)
+			stack.append(_child_items(val))
+
+def _child_items(val):
+	if isinstance(val, dict):
+		return iter(val.items())
+	elif isinstance(val, list):
+		return enumerate(val)
+	return iter(())
+
+class compiled_path:
+	"""A POSIX-style path which has been parsed once, so that it can be used 
+	with a traversible many times without being parsed again.
+	
+	Usage: p = compile_path('/abc/def')
+		x[p], x.traverse(p), x.mkdir(p) ... accept it wherever a string path goes.
+	"""
+	def __init__(self, text):
+		self.text = text
+		self.absolute = text[:1] == '/'
+		self.parts = text.split('/')
+		# in '/dir/subdir/abc/', name = 'abc' and the container is '/dir/subdir/'.
+		(head, slash, self.name) = (text[:-1] if text[-1:] == '/' else text).rpartition('/')
+		self.container = head + slash
+	
+	def __repr__(self):
+		return "adso.utils.compile_path(%s)" % repr(self.text)
+
+def compile_path(path):
+	"Returns the compiled_path for a path string; compiled paths are returned as-is."
+	return path if isinstance(path, compiled_path) else compiled_path(path)
+
+_recurse = '**'
+_magic = re.compile(r'[*?[]')
+
+class compiled_pattern:
+	"""A glob pattern for traversible.glob(), parsed once so that it can be used
+	many times. Each segment of the pattern is matched against one key, with 
+	'*', '?' and '[...]' as in fnmatch, while a segment '**' matches any number
+	of directories, including none. Patterns may start with '/' or '..'.
+	
+	Usage: p = compile_pattern('/**/email')
+	"""
+	def __init__(self, text):
+		self.text = text
+		self.absolute = text[:1] == '/'
+		parts = [part for part in text.split('/') if part not in ('', '.')]
+		self.ups = 0
+		while self.ups < len(parts) and parts[self.ups] == '..':
+			self.ups += 1
+		segments = []
+		for part in parts[self.ups:]:
+			if part == '..':
+				raise ValueError("'..' may only begin a pattern: '%s'" % text)
+			elif part == _recurse:
+				# '**/**' matches just what '**' does.
+				if len(segments) == 0 or segments[-1] is not _recurse:
+					segments.append(_recurse)
+			elif _magic.search(part):
+				segments.append(re.compile(fnmatch.translate(part)).match)
+			else:
+				segments.append(part)
+		self.segments = tuple(segments)
 	
-	return recurse({"": tree}, "", tree)
+	def closure(self, states):
+		"""Returns the set of states (indices of segments, len(segments) meaning 
+		a match) which `states` stand for, since '**' may also match nothing."""
+		out = set()
+		for i in states:
+			out.add(i)
+			while i < len(self.segments) and self.segments[i] is _recurse:
+				i += 1
+				out.add(i)
+		return out
+	
+	def step(self, states, key):
+		"Returns the states after matching `key` from `states`."
+		out = []
+		for i in states:
+			if i == len(self.segments):
+				continue
+			segment = self.segments[i]
+			if segment is _recurse:
+				out.append(i)
+			elif segment == key if type(segment) == str else segment(key):
+				out.append(i + 1)
+		return self.closure(out)
+	
+	def keys(self, states):
+		"""Returns the only keys which can match from `states`, or None if any 
+		key might match."""
+		keys = set()
+		for i in states:
+			if i < len(self.segments):
+				if type(self.segments[i]) != str or self.segments[i] is _recurse:
+					return None
+				keys.add(self.segments[i])
+		return keys
+	
+	def __repr__(self):
+		return "adso.utils.compile_pattern(%s)" % repr(self.text)
+
+def compile_pattern(pattern):
+	"Returns the compiled_pattern for a pattern string; compiled ones are returned as-is."
+	return pattern if isinstance(pattern, compiled_pattern) else compiled_pattern(pattern)
+
+class _lazy:
+	"""A dict inside a traversible which will become a traversible itself when 
+	it is first used, so that building a large tree only wraps its top level."""
+	__slots__ = ('d',)
+	def __init__(self, d):
+		self.d = d
+
+def _lazy_contents(d):
+	return {k: _lazy(v) if isinstance(v, dict) else v for (k, v) in d.items()}
+
+def _check_keys(d):
+	"Raises ValueError if any key of d, or of any dict inside it, is not traversible."
+	stack = [d]
+	while len(stack) > 0:
+		d = stack.pop()
+		for key in d:
+			if '/' in key or key in ('', '.', '..'):
+				raise ValueError("Non-traversible key in dictionary: '%s'" % key)
+			if isinstance(d[key], dict):
+				stack.append(d[key])
+
+def _copy_dicts(d):
+	return {k: _copy_dicts(v) if isinstance(v, dict) else v for (k, v) in d.items()}
+
+_missing = object()
 
 class traversible:
 	"""A dict-like class which implements traversal by POSIX-style paths.
@@ -104,24 +327,71 @@ class traversible:
 		x["/ghi/c"] = 2
 	The flexibility comes at a simple cost: keys can no longer contain forward 
 	slashes, and cannot be '.', '..', or ''. 
+	
+	The root remembers where the last `cache_size` paths led, so that looking 
+	up the same path again costs about as much as a dict lookup. Because the 
+	nodes have __slots__, cache_size is a setting of the whole class, changed 
+	with traversible.cache_size = n rather than on one tree. The remembered
+	paths are forgotten by remove(), __setitem__() and mkdir() whenever they 
+	change a key that the path went through; code which modifies `contents` 
+	directly must call _invalidate(container, key) itself.
+	
+	Once complete() has been used in a directory, it keeps the directory's keys
+	in a sorted list, so that the keys with a given prefix are found by binary
+	search. The methods above keep that list up to date too; code which changes
+	`contents` directly must call _index(key, added) as well.
+	
+	The dicts inside a tree are only made into traversibles when they are first
+	used, so the tree takes them over: they should not be changed afterwards 
+	except through the tree. Until then, `contents` holds them wrapped in 
+	_lazy objects; use _child(key) to read a child of `contents`.
 	"""
+	__slots__ = ('key', 'parent', 'root', 'contents', '_cache', '_deps', '_seen', '_sorted')
+	cache_size = 2**14
+	
 	def _absorb_dict(self, d):
 		"""Inserts key-value pairs from the given dict into this traversible. 
 		If a dict is encountered as a child of d, that dict is also converted 
-		into a traversible with this method. An improper state may result if 
-		you absorb a dict which contains keys that you already have."""
+		into a traversible when it is first used. An improper state may result 
+		if you absorb a dict which contains keys that you already have."""
+		_check_keys(d)
+		if len(self.contents) == 0:
+			# no remembered path can go through an empty directory.
+			self.contents = _lazy_contents(d)
+			self._sorted = None
+			return
 		for key in d:
-			if '/' in key or key in ('', '.', '..'):
-				raise ValueError("Non-traversible key in dictionary: '%s'" % key)
 			if key in self.contents:
 				del self[key]
-			if isinstance(d[key], dict):
-				self[key] = traversible(d[key], key, self)
-			else:
-				self[key] = d[key]
+			self.contents[key] = _lazy(d[key]) if isinstance(d[key], dict) else d[key]
+			self._invalidate(self, key)
+			self._index(key, True)
+	
+	def _child(self, key):
+		"""Returns contents[key], first making it a traversible if it is still 
+		a dict from the one that this tree was built from."""
+		value = self.contents[key]
+		if type(value) == _lazy:
+			child = traversible(key=key, parent=self)
+			child.contents = _lazy_contents(value.d)
+			value = self.contents[key] = child
+		return value
+	
+	def _is_dir(self, key):
+		return isinstance(self.contents[key], (traversible, _lazy))
+	
+	@property
+	def path(self):
+		"The absolute path of this directory, such as '/abc/def'."
+		keys = []
+		node = self
+		while node.parent is not node:
+			keys.append(node.key)
+			node = node.parent
+		return '/' + '/'.join(reversed(keys))
 	
 	def ls(self, pretty_print=False):
-		dir_postfix = lambda s: s + '/' if isinstance(self.contents[s], traversible) else s
+		dir_postfix = lambda s: s + '/' if self._is_dir(s) else s
 		keys = sorted([dir_postfix(key) for key in self.contents.keys()])
 		if pretty_print:
 			print(self.path + " :: ")
@@ -130,57 +400,259 @@ class traversible:
 			return keys
 	
 	def __init__(self, from_dict=None, key="<?>", parent=None):
+		"""Makes a directory; a root if `parent` is None, holding the contents of
+		`from_dict`. The dicts inside `from_dict` are not copied: each becomes 
+		a traversible the first time it is used, so a change made to one of them
+		afterwards, without going through the tree, shows up if that subtree has 
+		not been used yet but not if it has, and its keys are never checked. 
+		Pass a copy if the dicts will still be changed."""
+		self.key = key
 		if parent == None:
 			self.parent = self
 			self.root = self
-			self.path = '/' 
+			# path -> (start, result, edges), edges being the (container, key) 
+			# pairs the path went through; _deps maps each edge to its paths.
+			# Keying on the text alone, whose hash Python keeps, makes a lookup
+			# cheap; a relative path is remembered from one start at a time.
+			self._cache = OrderedDict()
+			self._deps = {}
+			# path -> start of the paths looked up once, which are remembered if
+			# they come again.
+			self._seen = {}
 		else:
 			self.parent = parent
 			self.root = parent.root
-			if parent.path == '/':
-				self.path = '/' + key
-			else:
-				self.path = parent.path + '/' + key
 		self.contents = {}
+		self._sorted = None # the sorted keys, once complete() has needed them
 		if from_dict != None:
 			self._absorb_dict(from_dict)
 	
+	def glob(self, pattern, values=False):
+		"""Yields the absolute path of everything which matches the pattern, 
+		such as '/*/email' or '**/email'; see compiled_pattern. If `values` is 
+		True, yields (path, value) pairs instead. 
+		
+		The tree is walked depth-first, one directory at a time, without 
+		entering directories which cannot match; so the first results come 
+		at once, and the memory used grows only with the depth of the tree.
+		The dicts of subtrees which have not been used yet are walked as they 
+		are, and only made into traversibles when one is yielded as a value.
+		The tree should not be changed until the walk is finished."""
+		pattern = compile_pattern(pattern)
+		start = self.root if pattern.absolute else self
+		for i in range(0, pattern.ups):
+			start = start.parent
+		done = len(pattern.segments)
+		
+		def children(contents, states):
+			keys = pattern.keys(states)
+			if keys == None:
+				return iter(contents)
+			elif len(keys) == 1:
+				# only the one literal key needs to be looked up.
+				return iter([key for key in keys if key in contents])
+			return iter([key for key in contents if key in keys])
+		
+		def wrap(node, trail):
+			# the traversible at the keys `trail` below the traversible `node`.
+			for key in trail:
+				node = node._child(key)
+			return node
+		
+		states = pattern.closure([0])
+		path = start.path
+		if done in states:
+			yield (path, start) if values else path
+		# Each level is (contents, path, states, keys, node, trail): `node` is the 
+		# nearest traversible above it and `trail` the keys from there, which is 
+		# () when `contents` belongs to `node`; otherwise `contents` is a dict 
+		# in which every dict is a directory.
+		stack = [(start.contents, path, states, children(start.contents, states), start, ())]
+		while len(stack) > 0:
+			(contents, path, states, keys, node, trail) = stack[-1]
+			key = next(keys, None)
+			if key == None:
+				stack.pop()
+				continue
+			after = pattern.step(states, key)
+			if len(after) == 0:
+				continue
+			value = contents[key]
+			if isinstance(value, traversible):
+				level = (value.contents, value, ())
+			elif type(value) == _lazy:
+				level = (value.d, node, trail + (key,))
+			elif len(trail) > 0 and isinstance(value, dict):
+				level = (value, node, trail + (key,))
+			else:
+				level = None
+			subpath = path + key if path == '/' else path + '/' + key
+			if done in after:
+				if not values:
+					yield subpath
+				elif level != None:
+					yield (subpath, wrap(level[1], level[2]))
+				else:
+					yield (subpath, value)
+			if level != None and min(after) < done:
+				stack.append((level[0], subpath, after, children(level[0], after)) + level[1:])
+	
+	def find(self, pattern, values=False):
+		"""Yields the path of everything at or below this directory whose key 
+		matches the fnmatch pattern, like glob('**/' + pattern)."""
+		return self.glob('**/' + pattern, values)
+	
 	def _as_dict(self, recurse=True):
 		output = {}
-		for key in self.contents:
-			if recurse and isinstance(self.contents[key], traversible):
-				output[key] = self.contents[key]._as_dict()
+		for (key, value) in self.contents.items():
+			if recurse and isinstance(value, traversible):
+				output[key] = value._as_dict()
+			elif type(value) == _lazy:
+				output[key] = _copy_dicts(value.d) if recurse else self._child(key)
 			else:
-				output[key] = self.contents[key]
+				output[key] = value
 		return output
 	
+	def _shallow_dict(self):
+		"""One level of this tree as a dict, in which the subtrees that have not 
+		been used yet are still the dicts they were built from. adso serializes 
+		a tree through this, one level at a time, instead of through _as_dict()."""
+		return {k: v.d if type(v) == _lazy else v for (k, v) in self.contents.items()}
+	
 	def __repr__(self):
 		return "adso.utils.traversible(from_dict=%s)" % repr(self._as_dict())
 	
 	def traverse(self, path):
 		"""Traverses a set of adso.utils.traversible objects with a POSIX-style path."""
-		if path == '':
+		if isinstance(path, compiled_path):
+			(text, parts) = (path.text, path.parts)
+		else:
+			(text, parts) = (path, None)
+		if text == '':
 			return self
 		# leading / starts at root:
-		current = self.root if path[0] == "/" else self  
-		path = path.split('/')
-		end = len(path) - 1
-		subpath = lambda k: '/'.join(path[0:k])
-		for i in range(0, len(path)):
-			key = path[i]
-			if not isinstance(current, traversible):
-				raise KeyError("Is not traversible: '%s'" % subpath(i))
+		start = self.root if text[0] == "/" else self
+		root = self.root
+		cache = root._cache
+		entry = cache.get(text)
+		if entry != None and entry[0] is start:
+			cache.move_to_end(text)
+			return entry[1]
+		if parts == None:
+			parts = text.split('/')
 		
-			if key == "..":
-				current = current.parent
-			elif key in ("", "."):
-				pass
-			else: 
-				if key not in current.contents:
-					raise KeyError("Does not exist: '%s'" % subpath(i + 1))
-				current = current.contents[key]
+		# a path is only remembered when it is looked up for the second time, so
+		# that lookups which are never repeated cost no more than the walk.
+		seen = root._seen
+		if seen.get(text) is not start:
+			if len(seen) >= self.cache_size:
+				seen.clear()
+			seen[text] = start
+			return start._walk(parts, None)
+		del seen[text]
+		edges = []
+		current = start._walk(parts, edges)
+		
+		# remember the result, and which keys it depends upon; the same text 
+		# from another directory takes the place of the old entry.
+		if entry != None:
+			del cache[text]
+			root._forget(text, entry[2])
+		cache[text] = (start, current, edges)
+		deps = root._deps
+		for edge in edges:
+			if edge in deps:
+				deps[edge].add(text)
+			else:
+				deps[edge] = {text}
+		if len(cache) > self.cache_size:
+			(old, (_, _, old_edges)) = cache.popitem(last=False)
+			root._forget(old, old_edges)
 		return current
 	
+	def _walk(self, parts, edges):
+		"""Follows the split path `parts` from here, appending the (container, 
+		key) pairs which it goes through to `edges` unless that is None."""
+		current = self
+		for step in parts:
+			if not isinstance(current, traversible):
+				break
+			if step == "..":
+				current = current.parent
+			elif step != "" and step != ".":
+				value = current.contents.get(step, _missing)
+				if value is _missing:
+					break
+				if edges != None:
+					edges.append((current, step))
+				current = current._child(step) if type(value) is _lazy else value
+		else:
+			return current
+		self._fail(parts)
+	
+	def _fail(self, parts):
+		"Raises the KeyError for a path which _walk() could not follow."
+		current = self
+		for (i, step) in enumerate(parts):
+			if not isinstance(current, traversible):
+				raise KeyError("Is not traversible: '%s'" % '/'.join(parts[0:i]))
+			if step == "..":
+				current = current.parent
+			elif step not in ("", "."):
+				if step not in current.contents:
+					raise KeyError("Does not exist: '%s'" % '/'.join(parts[0:i + 1]))
+				current = current._child(step)
+	
+	def _forget(self, key, edges):
+		for edge in edges:
+			keys = self._deps.get(edge)
+			if keys != None:
+				keys.discard(key)
+				if len(keys) == 0:
+					del self._deps[edge]
+	
+	def _invalidate(self, container, name):
+		"""Forgets every remembered path which went through container[name]."""
+		root = self.root
+		for key in root._deps.pop((container, name), ()):
+			entry = root._cache.pop(key, None)
+			if entry != None:
+				root._forget(key, entry[2])
+	
+	def _index(self, key, added):
+		"Keeps the sorted keys, if there are any yet, up to date with `contents`."
+		keys = self._sorted
+		if keys != None:
+			i = bisect_left(keys, key)
+			present = i < len(keys) and keys[i] == key
+			if added and not present:
+				keys.insert(i, key)
+			elif present and not added:
+				del keys[i]
+	
+	def complete(self, text):
+		"""Returns the ways to finish typing a path, as a shell completes them:
+		`text` is a path from this directory whose last segment is only partly 
+		typed, and each result is `text` finished with one key of the directory
+		it leads to, with a '/' after the keys of directories. For example, 
+		x.complete('/ab') might give ['/abc/', '/abd']."""
+		(head, slash, partial) = text.rpartition('/')
+		try:
+			container = self.traverse(head + slash)
+		except KeyError:
+			return []
+		if not isinstance(container, traversible):
+			return []
+		if container._sorted == None:
+			container._sorted = sorted(container.contents)
+		(keys, out) = (container._sorted, [])
+		i = bisect_left(keys, partial)
+		while i < len(keys) and keys[i].startswith(partial):
+			key = keys[i]
+			out.append(head + slash + key + ('/' if container._is_dir(key) else ''))
+			i += 1
+		return out
+	
 	def mkdir(self, path):
 		"""Makes a subdirectory which is also traversible."""
 		(container, name) = self._get_dir(path)
@@ -189,7 +661,9 @@ class traversible:
 		elif '/' in name or name in ('', '.', '..'):
 			raise KeyError("Invalid path label: '%s'" % name)
 		else:
-			container.contents[name] = traversible(key=name, parent=self)
+			container.contents[name] = traversible(key=name, parent=container)
+			container._invalidate(container, name)
+			container._index(name, True)
 			return container.contents[name]
 	
 	def remove(self, item_name):
@@ -199,6 +673,8 @@ class traversible:
 		you to "catch" items as they are removed from the directory tree. This 
 		method occurs *after* POSIX-style path resolution has occurred."""
 		del self.contents[item_name]
+		self._invalidate(self, item_name)
+		self._index(item_name, False)
 	
 	def __getitem__(self, path):
 		return self.traverse(path)
@@ -207,13 +683,17 @@ class traversible:
 		(container, name) = self._get_dir(path)
 		if name not in container.contents:
 			container.contents[name] = value
-		elif isinstance(container.contents[name], traversible):
+			container._invalidate(container, name)
+			container._index(name, True)
+		elif container._is_dir(name):
 			raise ValueError("Is a directory: %s" % path )
 		elif '/' in name or name in ('', '.', '..'):
 			raise ValueError("Invalid path label: '%s'" % name)
 		else:
 			container.remove(name)
 			container.contents[name] = value
+			container._invalidate(container, name)
+			container._index(name, True)
 	
 	def __delitem__(self, path):
 		(container, name) = self._get_dir(path)
@@ -237,11 +717,8 @@ class traversible:
 		call the containing directory's .remove() function.
 
 		"""
-		# in self.mkdir('/dir/subdir/abc/'), name = 'abc', data[0] = 'abc/' 
-		data = re.search(r"([^/]*)/?$", path)
-		name = data.group(1)
-		# we strip off data[0] to create '/dir/subdir/', and travel there.
-		container_path = path[:-len(data.group(0))]
+		path = compile_path(path)
+		(container_path, name) = (path.container, path.name)
 		container = self.traverse(container_path)
 		if not isinstance(container, traversible):
 			raise ValueError("Not a directory: %s" % container_path)